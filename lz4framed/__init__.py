@@ -41,13 +41,45 @@ from _lz4framed import (  # noqa (unused import)
     LZ4F_ERROR_headerChecksum_invalid, LZ4F_ERROR_contentChecksum_invalid, LZ4F_ERROR_frameDecoding_alreadyStarted,
     LZ4F_VERSION, LZ4_VERSION, __version__,
     Lz4FramedError, Lz4FramedNoDataError,
-    compress, decompress,
+    compress, decompress, compress_into, decompress_into,
     create_compression_context, compress_begin, compress_update, compress_end,
-    create_decompression_context, get_frame_info, decompress_update,
+    create_decompression_context, get_frame_info, decompress_update, reset_decompression_context,
+    compress_fd, decompress_fd,
     get_block_size
 )
 
-from .compat import Iterable as __Iterable
+# Idle contexts re-used by Compressor & Decompressor instances, to avoid having to allocate lz4 state (and its internal
+# buffers) for every frame. (Appending to & popping from a list is atomic.) Contexts last used with large blocks are
+# not retained since their buffers (up to ~8MB per context) would be held indefinitely.
+_CONTEXT_POOL_SIZE = 8
+_CONTEXT_POOL_EXCLUDED_BLOCK_SIZE_IDS = frozenset((LZ4F_BLOCKSIZE_MAX1MB, LZ4F_BLOCKSIZE_MAX4MB))
+_cctx_pool = []
+_dctx_pool = []
+
+
+def _acquire_context(pool, create):
+    try:
+        return pool.pop()
+    except IndexError:
+        return create()
+
+
+def _release_context(pool, ctx, block_size_id):
+    if block_size_id not in _CONTEXT_POOL_EXCLUDED_BLOCK_SIZE_IDS and len(pool) < _CONTEXT_POOL_SIZE:
+        pool.append(ctx)
+
+
+class _NoLock(object):
+    """Stands in for Lock for instances not shared between threads"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NO_LOCK = _NoLock()
 
 
 class Compressor(object):
@@ -75,22 +107,25 @@ class Compressor(object):
     """
 
     def __init__(self, fp=None, block_size_id=LZ4F_BLOCKSIZE_DEFAULT, block_mode_linked=True, checksum=False,
-                 autoflush=False, level=LZ4F_COMPRESSION_MIN, block_checksum=False):
+                 autoflush=False, level=LZ4F_COMPRESSION_MIN, block_checksum=False, thread_safe=True):
         """
         Args:
             fp: File like object (supporting write() method) to write compressed data to. If not set, data will be
                 returned by the update(), flush() and end() methods.
             block_size_id (int): Compression block size identifier. One of the LZ4F_BLOCKSIZE_* constants
             block_mode_linked (bool): Whether compression blocks are linked
-            checksum (bool): Whether to produce frame checksum
+            checksum (bool): Whether to produce frame checksum (additional cost on both compression & decompression)
             autoflush (bool): Whether to return (or write to fp) compressed data on each update() call rather than
                               waiting for internal buffer to be filled. (This reduces internal buffer size.)
             level (int): Compression level. Values lower than 3 (including negative ones) use fast compression.
                          Recommended range for hc compression is between 4 and 9, with a maximum of LZ4_COMPRESSION_MAX.
-            block_checksum (bool): Whether to produce checksum after each block
+            block_checksum (bool): Whether to produce checksum after each block (as above)
+            thread_safe (bool): Whether the instance can be used by multiple threads concurrently. If not set, the
+                                caller is responsible for ensuring only one thread uses it at a time.
         """
-        self.__ctx = create_compression_context()
-        self.__lock = Lock()
+        self.__ctx = _acquire_context(_cctx_pool, create_compression_context)
+        self.__lock = Lock() if thread_safe else _NO_LOCK
+        self.__block_size_id = block_size_id
         if fp is None:
             self.__write = None
         elif not callable(fp.write):
@@ -100,6 +135,11 @@ class Compressor(object):
         self.__header = compress_begin(self.__ctx, block_size_id=block_size_id, block_mode_linked=block_mode_linked,
                                        checksum=checksum, autoflush=autoflush, level=level,
                                        block_checksum=block_checksum)
+        if self.__write:
+            # header written immediately so update() does not have to check for it (and an empty frame is valid)
+            self.__write(self.__header)
+            self.__header = None
+            self.update = self.__updateNextWrite if thread_safe else self.__updateNextWriteUnlocked
 
     def __enter__(self):
         if self.__write is None:
@@ -113,38 +153,50 @@ class Compressor(object):
         """Compress data given in b, returning compressed result either from this function or writing to fp). Note:
            sometimes output might be zero length (if being buffered by lz4).
            Raises Lz4FramedNoDataError if input is of zero length."""
+        # Only used for first call without fp: header placed directly in output buffer (rather than concatenating
+        # after), subsequent calls use __updateNextReturn.
         with self.__lock:
-            output = compress_update(self.__ctx, b)
-            if self.__write:
-                self.__write(self.__header)
-                self.__header = None
-                self.__write(output)
-                self.update = self.__updateNextWrite
-                return None
-
-            header = self.__header
+            output = compress_update(self.__ctx, b, self.__header)
             self.__header = None
-            self.update = self.__updateNextReturn
-            return header + output
+            self.update = self.__updateNextReturn if self.__lock is not _NO_LOCK else self.__updateNextReturnUnlocked
+            return output
 
-    # post-first update methods so do not require header write & fp checks
+    # post-first update methods so do not require header write & fp checks. The lock (if thread safe) ensures the
+    # context is not used after (or during) end(), since it is then released for use by other instances.
     def __updateNextWrite(self, b):  # pylint: disable=invalid-name
-        self.__write(compress_update(self.__ctx, b))
+        with self.__lock:
+            self.__write(compress_update(self.__ctx, b))
 
     def __updateNextReturn(self, b):  # pylint: disable=invalid-name
+        with self.__lock:
+            return compress_update(self.__ctx, b)
+
+    def __updateNextWriteUnlocked(self, b):  # pylint: disable=invalid-name
+        self.__write(compress_update(self.__ctx, b))
+
+    def __updateNextReturnUnlocked(self, b):  # pylint: disable=invalid-name
         return compress_update(self.__ctx, b)
 
     def end(self):
-        """Finalise lz4 frame, outputting any remaining as return from this function or by writing to fp)"""
+        """Finalise lz4 frame, outputting any remaining as return from this function or by writing to fp). The
+           compressor cannot be used after this call."""
         with self.__lock:
+            output = compress_end(self.__ctx)
+            # context can be re-used for next frame
+            _release_context(_cctx_pool, self.__ctx, self.__block_size_id)
+            self.__ctx = None
             if self.__write:
-                self.__write(compress_end(self.__ctx))
+                self.__write(output)
                 return None
 
-            return compress_end(self.__ctx)
+            if self.__header is not None:
+                # no data supplied, frame consists of header & end mark only
+                output = self.__header + output
+                self.__header = None
+            return output
 
 
-class Decompressor(__Iterable):  # pylint: disable=super-init-not-called
+class Decompressor(object):
     """Iteratively decompress blocks of an lz4-frame from a file-like object, e.g.:
 
         with open('myFile', 'rb') as f:
@@ -157,14 +209,24 @@ class Decompressor(__Iterable):  # pylint: disable=super-init-not-called
     The decompressor will automatically choose a meaningful read size. Note that some
     iterator calls might return zero-length data. The iterator raises LZ4FNoDataError
     if input (from fp.read) is of zero length, before decompression finished.
+
+    If each chunk is consumed immediately (e.g. written to another file), use reuse_buffer to
+    avoid allocating a new block-sized bytes object for every chunk:
+
+        for chunk in Decompressor(f, reuse_buffer=True):
+            out.write(chunk)
     """
 
-    def __init__(self, fp):
+    def __init__(self, fp, reuse_buffer=False, thread_safe=True):
         """
         Args:
             fp: File like object (supporting read() method) to read compressed data from.
+            reuse_buffer (bool): Whether to decompress into a single internal buffer. If set, the iterator
+                                 returns memoryview instances which are only valid until the next iteration,
+                                 i.e. the caller must use or copy each chunk before requesting the next one.
+            thread_safe (bool): Whether the instance can be used by multiple threads concurrently. If not set, the
+                                caller is responsible for ensuring only one thread uses it at a time.
         """
-        super(Decompressor, self).__init__()
         if fp is None:
             raise TypeError('fp')
         elif not callable(fp.read):
@@ -172,36 +234,51 @@ class Decompressor(__Iterable):  # pylint: disable=super-init-not-called
         else:
             self.__read = fp.read
         self.__info = None
-        self.__ctx = create_decompression_context()
-        self.__lock = Lock()
+        self.__ctx = None
+        self.__reuse_buffer = reuse_buffer
+        self.__buffer = None
+        self.__lock = Lock() if thread_safe else _NO_LOCK
 
     def __iter__(self):
-        ctx = self.__ctx
         read = self.__read
-        input_hint = 15  # enough to read largest header
+        update = decompress_update
+        # smallest header size, i.e. reads never go beyond the header (and first block header) so that all subsequent
+        # reads (of input_hint bytes) are aligned with block boundaries
+        input_hint = 7
         chunk_size = 32  # output chunk size, will be increased once block size known
+        buffer = None
 
         with self.__lock:
-            output = decompress_update(ctx, read(input_hint), chunk_size)
-            try:
-                self.__info = info = get_frame_info(ctx)
-            except Lz4FramedError as ex:
-                if ex.args[1] != LZ4F_ERROR_frameHeader_incomplete:
-                    # should not happen since have read 15 bytes
-                    raise
-            else:
-                chunk_size = get_block_size(info['block_size_id'])
-            input_hint = output.pop()
-
-            # return any data as part of header read, if present
-            for element in output:
-                yield element
+            if self.__ctx is None:
+                self.__ctx = _acquire_context(_dctx_pool, create_decompression_context)
+            ctx = self.__ctx
+            info = None
+            # header reads produce no output
+            while info is None:
+                input_hint = update(ctx, read(input_hint), chunk_size).pop()
+                try:
+                    info = get_frame_info(ctx)
+                # header not yet fully read
+                except Lz4FramedError as ex:
+                    if ex.args[1] not in (LZ4F_ERROR_frameHeader_incomplete, LZ4F_ERROR_frameDecoding_alreadyStarted):
+                        raise
+            self.__info = info
+            chunk_size = get_block_size(info['block_size_id'])
+            if self.__reuse_buffer:
+                # lz4 produces at most one block per call when supplied with (aligned) input_hint bytes
+                if self.__buffer is None or len(self.__buffer) != chunk_size:
+                    self.__buffer = bytearray(chunk_size)
+                buffer = self.__buffer
 
             while input_hint > 0:
-                output = decompress_update(ctx, read(input_hint), chunk_size)
+                output = update(ctx, read(input_hint), chunk_size, buffer)
                 input_hint = output.pop()
-                for element in output:
-                    yield element
+                yield from output
+
+            # frame complete - context can be re-used (a further iteration will decompress the next frame)
+            self.__ctx = None
+            reset_decompression_context(ctx)
+            _release_context(_dctx_pool, ctx, info['block_size_id'])
 
     @property
     def frame_info(self):
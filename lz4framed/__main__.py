@@ -15,31 +15,99 @@
 
 """(de)compresses to/from lz4-framed data"""
 
-from __future__ import print_function
+from io import BufferedWriter, RawIOBase
+from os import fstat
+from stat import S_ISREG
 from sys import argv, stderr
 
 from .compat import STDIN_RAW, STDOUT_RAW
-from . import Compressor, Decompressor, Lz4FramedError, Lz4FramedNoDataError, get_block_size
+from . import (Compressor, Decompressor, Lz4FramedError, Lz4FramedNoDataError, get_block_size, compress_fd,
+               decompress_fd, LZ4F_BLOCKSIZE_MAX64KB, LZ4F_BLOCKSIZE_MAX1MB, LZ4F_BLOCKSIZE_MAX4MB)
 
 
 def __error(*args, **kwargs):
     print(*args, file=stderr, **kwargs)
 
 
-def do_compress(in_stream, out_stream):
+def __fileno(stream):
+    try:
+        return stream.fileno()
+    # io.UnsupportedOperation is a ValueError
+    except (AttributeError, ValueError):
+        return None
+
+
+def __block_size_id(in_fd):
+    """Larger blocks for large input files (fewer iterations), smallest otherwise (less memory)"""
+    if in_fd is not None:
+        try:
+            stat = fstat(in_fd)
+        except OSError:
+            pass
+        else:
+            if S_ISREG(stat.st_mode):
+                if stat.st_size > 64 << 20:
+                    return LZ4F_BLOCKSIZE_MAX4MB
+                if stat.st_size > 4 << 20:
+                    return LZ4F_BLOCKSIZE_MAX1MB
+    return LZ4F_BLOCKSIZE_MAX64KB
+
+
+def __compress_read(in_stream, update, read_size):
     read = in_stream.read
-    read_size = get_block_size()
     try:
-        with Compressor(out_stream) as compressor:
-            try:
-                while True:
-                    compressor.update(read(read_size))
-            # empty read result supplied to update()
-            except Lz4FramedNoDataError:
-                pass
-            # input stream exception
-            except EOFError:
-                pass
+        while True:
+            update(read(read_size))
+    # empty read result supplied to update()
+    except Lz4FramedNoDataError:
+        pass
+    # input stream exception
+    except EOFError:
+        pass
+
+
+def __compress_readinto(readinto, update, read_size):
+    # single buffer re-used for all reads
+    buffer = bytearray(read_size)
+    view = memoryview(buffer)
+    try:
+        while True:
+            count = readinto(buffer)
+            if not count:
+                break
+            update(view[:count])
+    # input stream exception
+    except EOFError:
+        pass
+
+
+def do_compress(in_stream, out_stream, block_size_id=LZ4F_BLOCKSIZE_MAX64KB):
+    read_size = get_block_size(block_size_id)
+    readinto = getattr(in_stream, 'readinto', None)
+    # coalesce (potentially small) compressed output into fewer writes on unbuffered streams
+    buffered = None
+    if isinstance(out_stream, RawIOBase):
+        out_stream = buffered = BufferedWriter(out_stream, buffer_size=max(read_size, 1 << 20))
+    try:
+        with Compressor(out_stream, block_size_id=block_size_id, thread_safe=False) as compressor:
+            if readinto is None:
+                __compress_read(in_stream, compressor.update, read_size)
+            else:
+                __compress_readinto(readinto, compressor.update, read_size)
+    except Lz4FramedError as ex:
+        __error('Compression error: %s' % ex)
+        return 8
+    finally:
+        if buffered is not None:
+            buffered.flush()
+            # leave underlying stream open (for caller to close)
+            buffered.detach()
+    return 0
+
+
+def do_compress_fd(in_fd, out_fd, block_size_id=LZ4F_BLOCKSIZE_MAX64KB):
+    try:
+        compress_fd(in_fd, out_fd, block_size_id=block_size_id)
     except Lz4FramedError as ex:
         __error('Compression error: %s' % ex)
         return 8
@@ -49,7 +117,7 @@ def do_compress(in_stream, out_stream):
 def do_decompress(in_stream, out_stream):
     write = out_stream.write
     try:
-        for chunk in Decompressor(in_stream):
+        for chunk in Decompressor(in_stream, reuse_buffer=True, thread_safe=False):
             write(chunk)
     except Lz4FramedError as ex:
         __error('Compression error: %s' % ex)
@@ -57,6 +125,29 @@ def do_decompress(in_stream, out_stream):
     return 0
 
 
+def do_decompress_fd(in_fd, out_fd):
+    try:
+        decompress_fd(in_fd, out_fd)
+    except Lz4FramedError as ex:
+        __error('Compression error: %s' % ex)
+        return 8
+    return 0
+
+
+def __dispatch(compress, in_stream, out_stream):
+    """Neither stream has been used yet, so can operate on underlying file descriptors directly (if available)"""
+    in_fd = __fileno(in_stream)
+    out_fd = __fileno(out_stream)
+    if compress:
+        block_size_id = __block_size_id(in_fd)
+        if in_fd is not None and out_fd is not None:
+            return do_compress_fd(in_fd, out_fd, block_size_id)
+        return do_compress(in_stream, out_stream, block_size_id)
+    if in_fd is not None and out_fd is not None:
+        return do_decompress_fd(in_fd, out_fd)
+    return do_decompress(in_stream, out_stream)
+
+
 __ACTION = frozenset(('compress', 'decompress'))
 
 
@@ -85,12 +176,12 @@ which case stdin is used. If OUTFILE is not specified, output goes to stdout."""
             out_stream = STDOUT_RAW
         else:
             try:
-                out_stream = out_file = open(argv[3], 'ab')
+                out_stream = out_file = open(argv[3], 'wb')
             except IOError as ex:
-                __error('Failed to open output file for appending: %s' % ex)
+                __error('Failed to open output file for writing: %s' % ex)
                 return 4
 
-        return (do_compress if compress else do_decompress)(in_stream, out_stream)
+        return __dispatch(compress, in_stream, out_stream)
     except IOError as ex:
         __error('I/O failure: %s' % ex)
     finally:
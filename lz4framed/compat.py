@@ -34,26 +34,10 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-"""Python v2.7 (NOT 2.6) compatibility"""
+"""Binary standard streams"""
 
-# pylint: disable=unused-import,invalid-name,wrong-import-order
+from sys import stderr, stdout, stdin
 
-from sys import stderr, stdout, stdin, version_info
-
-try:
-    # pylint: disable=no-name-in-module
-    from collections.abc import Iterable
-except ImportError:
-    from collections import Iterable  # noqa
-
-PY2 = (version_info[0] == 2)
-
-if PY2:
-    STDIN_RAW = stdin
-    STDOUT_RAW = stdout
-    STDERR_RAW = stderr
-
-else:
-    STDIN_RAW = getattr(stdin, 'buffer', stdin)
-    STDOUT_RAW = getattr(stdout, 'buffer', stdout)
-    STDERR_RAW = getattr(stderr, 'buffer', stderr)
+STDIN_RAW = getattr(stdin, 'buffer', stdin)
+STDOUT_RAW = getattr(stdout, 'buffer', stdout)
+STDERR_RAW = getattr(stderr, 'buffer', stderr)
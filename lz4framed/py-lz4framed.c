@@ -20,6 +20,20 @@
 #include <Python.h>
 #include <bytesobject.h>
 
+#include <errno.h>
+#ifdef _WIN32
+    #include <io.h>
+    #define FD_READ(fd, buf, count) _read((fd), (buf), (unsigned int)(count))
+    #define FD_WRITE(fd, buf, count) _write((fd), (buf), (unsigned int)(count))
+#else
+    #include <unistd.h>
+    #include <sys/mman.h>
+    #include <sys/stat.h>
+    #define FD_MMAP_SUPPORTED
+    #define FD_READ(fd, buf, count) read((fd), (buf), (count))
+    #define FD_WRITE(fd, buf, count) write((fd), (buf), (count))
+#endif
+
 #define LZ4F_STATIC_LINKING_ONLY
 #include "lz4frame.h"
 #include "lz4hc.h"
@@ -30,6 +44,7 @@
 #define QUOTE(str) #str
 #define EXPAND_AND_QUOTE(str) QUOTE(str)
 #define MAX(x, y) (x) >= (y) ? (x) : (y)
+#define MIN(x, y) ((x) <= (y) ? (x) : (y))
 #define KB *(1<<10)
 #define MB *(1<<20)
 // Due to negative levels now being supported, this no longer is particularly meaningful.
@@ -135,6 +150,12 @@ typedef struct {
 
 static LZ4F_preferences_t prefs_defaults = {{0, 0, 0, 0, 0, 0, 0}, 0, 0, 0, {0}};
 
+/* Contexts re-used by compress() & decompress() to avoid (re-)allocating lz4 state (and internal buffers) on every
+ * call. Only taken & returned whilst holding the GIL, i.e. concurrent callers will allocate their own.
+ */
+static LZ4F_cctx *oneshot_cctx = NULL;
+static LZ4F_dctx *oneshot_dctx = NULL;
+
 /******************************************************************************/
 
 static int _valid_lz4f_block_size_id(int id) {
@@ -163,6 +184,86 @@ static size_t _lz4f_block_size_from_id(int id) {
     return blockSizes[id];
 }
 
+// Must be called with GIL held
+static void _release_oneshot_cctx(LZ4F_cctx *ctx) {
+    if (NULL == oneshot_cctx) {
+        oneshot_cctx = ctx;
+    } else {
+        LZ4F_freeCompressionContext(ctx);
+    }
+}
+
+// Must be called with GIL held. Contexts last used with large blocks are not retained since their internal buffers
+// (up to ~8MB) would otherwise be held indefinitely.
+static void _release_oneshot_dctx(LZ4F_dctx *ctx, int block_id) {
+    if (NULL == ctx) {
+        return;
+    }
+    if (NULL == oneshot_dctx && LZ4F_max1MB != block_id && LZ4F_max4MB != block_id) {
+        // might be in the middle of a frame if decompression failed
+        LZ4F_resetDecompressionContext(ctx);
+        oneshot_dctx = ctx;
+    } else {
+        LZ4F_freeDecompressionContext(ctx);
+    }
+}
+
+/******************************************************************************/
+
+/* Minimal argument parsing for METH_FASTCALL | METH_KEYWORDS functions: Assigns positional & keyword arguments to
+ * values, following the order of (NULL-terminated) keywords. The first positional_only arguments cannot be supplied
+ * by keyword. The first required arguments must be present, others are left untouched if not supplied (i.e. values
+ * should be pre-populated with defaults). Returns zero on success.
+ */
+static int _parse_fastcall_args(const char *func, PyObject *const *args, Py_ssize_t nargs, PyObject *kwnames,
+                                const char *const *keywords, Py_ssize_t positional_only, Py_ssize_t required,
+                                PyObject **values) {
+    Py_ssize_t max_args = 0;
+    Py_ssize_t nkwargs = (NULL == kwnames) ? 0 : PyTuple_GET_SIZE(kwnames);
+    Py_ssize_t i;
+    Py_ssize_t j;
+
+    while (keywords[max_args]) {
+        max_args++;
+    }
+    if (nargs + nkwargs > max_args) {
+        PyErr_Format(PyExc_TypeError, "%s() takes at most %zd arguments (%zd given)", func, max_args,
+                     nargs + nkwargs);
+        return -1;
+    }
+    for (i = 0; i < nargs; i++) {
+        values[i] = args[i];
+    }
+    for (j = 0; j < nkwargs; j++) {
+        PyObject *name = PyTuple_GET_ITEM(kwnames, j);
+
+        for (i = 0; i < max_args && PyUnicode_CompareWithASCIIString(name, keywords[i]); i++) {
+        }
+        if (i < positional_only || i == max_args) {
+            PyErr_Format(PyExc_TypeError, "'%U' is an invalid keyword argument for %s()", name, func);
+            return -1;
+        }
+        if (i < nargs) {
+            PyErr_Format(PyExc_TypeError, "argument for %s() given by name ('%s') and position (%zd)", func,
+                         keywords[i], i + 1);
+            return -1;
+        }
+        values[i] = args[nargs + j];
+    }
+    for (i = 0; i < required; i++) {
+        if (NULL == values[i]) {
+            PyErr_Format(PyExc_TypeError, "%s() missing required argument '%s' (pos %zd)", func, keywords[i], i + 1);
+            return -1;
+        }
+    }
+    return 0;
+}
+
+// Single argument "i" conversion (including its error messages). Returns zero on success.
+static int _parse_int_arg(PyObject *obj, int *value) {
+    return PyArg_Parse(obj, "i", value) ? 0 : -1;
+}
+
 /******************************************************************************/
 
 PyDoc_STRVAR(_lz4framed_get_block_size__doc__,
@@ -224,13 +325,10 @@ PyDoc_STRVAR(_lz4framed_compress__doc__,
                            _lz4framed_compress__doc__}
 static PyObject*
 _lz4framed_compress(PyObject *self, PyObject *args, PyObject *kwargs) {
-#if PY_MAJOR_VERSION >= 3
     static const char *format = "y*|iiiii:compress";
-#else
-    static const char *format = "s*|iiiii:compress";
-#endif
     static char *keywords[] = {"b", "block_size_id", "block_mode_linked", "checksum", "level", "block_checksum", NULL};
 
+    LZ4F_cctx *ctx = NULL;
     LZ4F_preferences_t prefs = prefs_defaults;
     Py_buffer input;
     int input_held = 0; // whether Py_buffer (input) needs to be released
@@ -278,11 +376,21 @@ _lz4framed_compress(PyObject *self, PyObject *args, PyObject *kwargs) {
     BAIL_ON_NULL(output = PyBytes_FromStringAndSize(NULL, output_len));
     BAIL_ON_NULL(output_str = PyBytes_AsString(output));
 
+    ctx = oneshot_cctx;
+    oneshot_cctx = NULL;
+    if (NULL == ctx) {
+        BAIL_ON_LZ4_ERROR(LZ4F_createCompressionContext(&ctx, LZ4F_VERSION));
+    }
+
     if (input.len < NOGIL_COMPRESS_INPUT_SIZE_THRESHOLD) {
-        BAIL_ON_LZ4_ERROR(output_len = LZ4F_compressFrame(output_str, output_len, input.buf, input.len, &prefs));
+        BAIL_ON_LZ4_ERROR(output_len = LZ4F_compressFrame_usingCDict(ctx, output_str, output_len, input.buf, input.len,
+                                                                     NULL, &prefs));
     } else {
-        BAIL_ON_LZ4_ERROR_NOGIL(output_len = LZ4F_compressFrame(output_str, output_len, input.buf, input.len, &prefs));
+        BAIL_ON_LZ4_ERROR_NOGIL(output_len = LZ4F_compressFrame_usingCDict(ctx, output_str, output_len, input.buf,
+                                                                           input.len, NULL, &prefs));
     }
+    _release_oneshot_cctx(ctx);
+    ctx = NULL;
     // output length might be shorter than estimated
     BAIL_ON_NONZERO(_PyBytes_Resize(&output, output_len));
 
@@ -294,6 +402,10 @@ bail:
     if (input_held) {
         PyBuffer_Release(&input);
     }
+    // state reset by compress_begin, so can still be re-used after failure
+    if (ctx) {
+        _release_oneshot_cctx(ctx);
+    }
     Py_XDECREF(output);
     return NULL;
 }
@@ -324,16 +436,13 @@ PyDoc_STRVAR(_lz4framed_decompress__doc__,
                              _lz4framed_decompress__doc__}
 static PyObject*
 _lz4framed_decompress(PyObject *self, PyObject *args, PyObject *kwargs) {
-#if PY_MAJOR_VERSION >= 3
     static const char *format = "y*|i:decompress";
-#else
-    static const char *format = "s*|i:decompress";
-#endif
     static char *keywords[] = {"b", "buffer_size", NULL};
 
     LZ4F_decompressionContext_t ctx = NULL;
     LZ4F_decompressOptions_t opt = {0, {0}};
     LZ4F_frameInfo_t frame_info;
+    int block_id = LZ4F_default;    // block size of frame, once known
     Py_buffer input;
     int input_held = 0;             // whether Py_buffer (input) needs to be released
     const char *input_pos;          // position in input
@@ -368,10 +477,15 @@ _lz4framed_decompress(PyObject *self, PyObject *args, PyObject *kwargs) {
     input_read = input_remaining = input.len;
     input_pos = input.buf;
 
-    BAIL_ON_LZ4_ERROR(LZ4F_createDecompressionContext(&ctx, LZ4F_VERSION));
+    ctx = oneshot_dctx;
+    oneshot_dctx = NULL;
+    if (NULL == ctx) {
+        BAIL_ON_LZ4_ERROR(LZ4F_createDecompressionContext(&ctx, LZ4F_VERSION));
+    }
 
     // retrieve uncompressed data size
     BAIL_ON_LZ4_ERROR(input_size_hint = LZ4F_getFrameInfo(ctx, &frame_info, input_pos, &input_read));
+    block_id = frame_info.blockSizeID;
     input_pos += input_read;
     input_remaining = input_read = input_remaining - input_read;
     if (frame_info.contentSize) {
@@ -428,7 +542,7 @@ _lz4framed_decompress(PyObject *self, PyObject *args, PyObject *kwargs) {
     BAIL_ON_NONZERO(_PyBytes_Resize(&output, output_len));
     PyBuffer_Release(&input);
     input_held = 0;
-    LZ4F_freeDecompressionContext(ctx);
+    _release_oneshot_dctx(ctx, block_id);
 
     return output;
 
@@ -437,7 +551,276 @@ bail:
         PyBuffer_Release(&input);
     }
     Py_XDECREF(output);
-    LZ4F_freeDecompressionContext(ctx);
+    _release_oneshot_dctx(ctx, block_id);
+    return NULL;
+}
+
+/******************************************************************************/
+
+/* Acquires writable buffer for out. If out is a bytearray with fewer than min_len bytes, it is enlarged first. (Holding
+ * the buffer prevents the bytearray from being resized elsewhere whilst the GIL is released.) Returns zero on success.
+ */
+static int _acquire_out_buffer(PyObject *out, Py_buffer *out_buf, size_t min_len) {
+    if (PyByteArray_Check(out) && (size_t)PyByteArray_GET_SIZE(out) < min_len) {
+        if (min_len > PY_SSIZE_T_MAX) {
+            PyErr_NoMemory();
+            return -1;
+        }
+        if (PyByteArray_Resize(out, (Py_ssize_t)min_len)) {
+            return -1;
+        }
+    }
+    return PyObject_GetBuffer(out, out_buf, PyBUF_WRITABLE);
+}
+
+// Releases buffer previously acquired via _acquire_out_buffer, shrinking out to len bytes if it is a bytearray.
+static int _release_out_buffer(PyObject *out, Py_buffer *out_buf, size_t len) {
+    PyBuffer_Release(out_buf);
+    if (PyByteArray_Check(out)) {
+        return PyByteArray_Resize(out, (Py_ssize_t)len);
+    }
+    return 0;
+}
+
+PyDoc_STRVAR(_lz4framed_compress_into__doc__,
+"compress_into(out, b, block_size_id=LZ4F_BLOCKSIZE_DEFAULT, block_mode_linked=True,\n"
+"              checksum=False, level=0, block_checksum=False) -> tuple\n"
+"\n"
+"Compresses the data given in b into a single lz4 frame like compress(), but writes\n"
+"it to the caller-supplied buffer out instead of allocating a new bytes object.\n"
+"Returns tuple of number of bytes written to out and number of bytes consumed from b.\n"
+"\n"
+"Args:\n"
+"    out (writable bytes-like object): Buffer to write frame to. A bytearray is\n"
+"                                      enlarged if required & resized to fit the\n"
+"                                      frame exactly. Any other buffer must be large\n"
+"                                      enough for the worst case (incompressible) frame.\n"
+"    b (bytes-like object): The object containing data to compress\n"
+"    Other arguments: See compress()\n"
+"\n"
+"Raises:\n"
+"    LZ4FNoDataError: If provided data is of zero length.\n"
+"    ValueError: If out (not being a bytearray) is too small\n"
+"    Lz4FramedError: If a compression failure occured");
+#define FUNC_DEF_COMPRESS_INTO {"compress_into", (PyCFunction)_lz4framed_compress_into, METH_VARARGS | METH_KEYWORDS,\
+                                _lz4framed_compress_into__doc__}
+static PyObject*
+_lz4framed_compress_into(PyObject *self, PyObject *args, PyObject *kwargs) {
+    static const char *format = "Oy*|iiiii:compress_into";
+    static char *keywords[] = {"out", "b", "block_size_id", "block_mode_linked", "checksum", "level", "block_checksum",
+                               NULL};
+
+    LZ4F_cctx *ctx = NULL;
+    LZ4F_preferences_t prefs = prefs_defaults;
+    PyObject *out;
+    Py_buffer out_buf = {NULL, NULL};
+    Py_buffer input;
+    int input_held = 0; // whether Py_buffer (input) needs to be released
+    Py_ssize_t input_len;
+    int block_id = LZ4F_default;
+    int block_mode_linked = 1;
+    int block_checksum = 0;
+    int checksum = 0;
+    int compression_level = LZ4_COMPRESSION_MIN;
+    size_t output_len;
+    UNUSED(self);
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, format, keywords, &out, &input, &block_id, &block_mode_linked,
+                                     &checksum, &compression_level, &block_checksum)) {
+        goto bail;
+    }
+    input_held = 1;
+
+    if (!PyBuffer_IsContiguous(&input, 'C')) {
+        PyErr_SetString(PyExc_ValueError, "input not contiguous");
+        goto bail;
+    }
+    if (input.len <= 0) {
+        PyErr_SetNone(LZ4FNoDataError);
+        goto bail;
+    }
+    if (!_valid_lz4f_block_size_id(block_id)) {
+        PyErr_Format(PyExc_ValueError, "block_size_id (%d) invalid", block_id);
+        goto bail;
+    }
+    if (compression_level > LZ4_COMPRESSION_MAX) {
+        PyErr_Format(PyExc_ValueError, "level (%d) invalid", compression_level);
+        goto bail;
+    }
+
+    prefs.frameInfo.contentSize = input.len;
+    prefs.frameInfo.blockMode = block_mode_linked ? LZ4F_blockLinked : LZ4F_blockIndependent;
+    prefs.frameInfo.blockSizeID = block_id;
+    prefs.frameInfo.blockChecksumFlag = block_checksum ? LZ4F_blockChecksumEnabled : LZ4F_noBlockChecksum;
+    prefs.frameInfo.contentChecksumFlag = checksum ? LZ4F_contentChecksumEnabled : LZ4F_noContentChecksum;
+    prefs.compressionLevel = compression_level;
+
+    BAIL_ON_LZ4_ERROR(output_len = LZ4F_compressFrameBound(input.len, &prefs));
+    BAIL_ON_NONZERO(_acquire_out_buffer(out, &out_buf, output_len));
+    if ((size_t)out_buf.len < output_len) {
+        PyErr_SetString(PyExc_ValueError, "out too small");
+        goto bail;
+    }
+
+    ctx = oneshot_cctx;
+    oneshot_cctx = NULL;
+    if (NULL == ctx) {
+        BAIL_ON_LZ4_ERROR(LZ4F_createCompressionContext(&ctx, LZ4F_VERSION));
+    }
+
+    if (input.len < NOGIL_COMPRESS_INPUT_SIZE_THRESHOLD) {
+        BAIL_ON_LZ4_ERROR(output_len = LZ4F_compressFrame_usingCDict(ctx, out_buf.buf, out_buf.len, input.buf,
+                                                                     input.len, NULL, &prefs));
+    } else {
+        BAIL_ON_LZ4_ERROR_NOGIL(output_len = LZ4F_compressFrame_usingCDict(ctx, out_buf.buf, out_buf.len, input.buf,
+                                                                           input.len, NULL, &prefs));
+    }
+    _release_oneshot_cctx(ctx);
+    ctx = NULL;
+
+    input_len = input.len;
+    PyBuffer_Release(&input);
+    input_held = 0;
+    BAIL_ON_NONZERO(_release_out_buffer(out, &out_buf, output_len));
+
+    return Py_BuildValue("nn", (Py_ssize_t)output_len, input_len);
+
+bail:
+    if (input_held) {
+        PyBuffer_Release(&input);
+    }
+    if (ctx) {
+        _release_oneshot_cctx(ctx);
+    }
+    PyBuffer_Release(&out_buf);
+    return NULL;
+}
+
+/******************************************************************************/
+
+PyDoc_STRVAR(_lz4framed_decompress_into__doc__,
+"decompress_into(out, b) -> tuple\n"
+"\n"
+"Decompresses the first lz4 frame in b like decompress(), but writes the uncompressed\n"
+"result to the caller-supplied buffer out instead of allocating a new bytes object.\n"
+"Returns tuple of number of bytes written to out and number of bytes consumed from b\n"
+"(i.e. the length of the frame, which might be followed by further data).\n"
+"\n"
+"Args:\n"
+"    out (writable bytes-like object): Buffer to write uncompressed data to. A\n"
+"                                      bytearray is enlarged if required & resized\n"
+"                                      to fit the data exactly.\n"
+"    b (bytes-like object): The object containing lz4-framed data to decompress\n"
+"\n"
+"Raises:\n"
+"    LZ4FNoDataError: If provided data is of zero length\n"
+"    ValueError: If out (not being a bytearray) is too small or the frame is incomplete\n"
+"    Lz4FramedError: If a decompression failure occured");
+#define FUNC_DEF_DECOMPRESS_INTO {"decompress_into", (PyCFunction)_lz4framed_decompress_into,\
+                                  METH_VARARGS | METH_KEYWORDS, _lz4framed_decompress_into__doc__}
+static PyObject*
+_lz4framed_decompress_into(PyObject *self, PyObject *args, PyObject *kwargs) {
+    static const char *format = "Oy*:decompress_into";
+    static char *keywords[] = {"out", "b", NULL};
+
+    LZ4F_decompressionContext_t ctx = NULL;
+    LZ4F_decompressOptions_t opt = {0, {0}};
+    LZ4F_frameInfo_t frame_info;
+    int block_id = LZ4F_default;    // block size of frame, once known
+    PyObject *out;
+    Py_buffer out_buf = {NULL, NULL};
+    int resizable;                  // whether out can be enlarged
+    Py_buffer input;
+    int input_held = 0;             // whether Py_buffer (input) needs to be released
+    Py_ssize_t input_len;
+    const char *input_pos;          // position in input
+    size_t input_remaining;         // bytes remaining in input
+    size_t input_read;              // used by LZ4 functions to indicate how many bytes were / can be read
+    size_t input_size_hint;         // LZ4 hint to how many bytes make up the remaining block + next header
+    size_t output_pos = 0;          // bytes written to out so far
+    size_t output_written;          // used by LZ4 to indicate how many bytes were / can be written
+    UNUSED(self);
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, format, keywords, &out, &input)) {
+        goto bail;
+    }
+    input_held = 1;
+
+    if (!PyBuffer_IsContiguous(&input, 'C')) {
+        PyErr_SetString(PyExc_ValueError, "input not contiguous");
+        goto bail;
+    }
+    if (input.len <= 0) {
+        PyErr_SetNone(LZ4FNoDataError);
+        goto bail;
+    }
+    input_read = input.len;
+    input_pos = input.buf;
+    resizable = PyByteArray_Check(out);
+    // output does not move between calls unless resized
+    opt.stableDst = !resizable;
+
+    ctx = oneshot_dctx;
+    oneshot_dctx = NULL;
+    if (NULL == ctx) {
+        BAIL_ON_LZ4_ERROR(LZ4F_createDecompressionContext(&ctx, LZ4F_VERSION));
+    }
+
+    BAIL_ON_LZ4_ERROR(input_size_hint = LZ4F_getFrameInfo(ctx, &frame_info, input_pos, &input_read));
+    block_id = frame_info.blockSizeID;
+    input_pos += input_read;
+    input_remaining = input.len - input_read;
+    BAIL_ON_NONZERO(_acquire_out_buffer(out, &out_buf, frame_info.contentSize));
+
+    while (input_size_hint) {
+        input_read = input_remaining;
+        output_written = out_buf.len - output_pos;
+        // Releasing GIL if input is very small could be inefficient
+        if (input_read < NOGIL_DECOMPRESS_INPUT_SIZE_THRESHOLD) {
+            BAIL_ON_LZ4_ERROR(input_size_hint = LZ4F_decompress(ctx, (char*)out_buf.buf + output_pos, &output_written,
+                                                                input_pos, &input_read, &opt));
+        } else {
+            BAIL_ON_LZ4_ERROR_NOGIL(input_size_hint = LZ4F_decompress(ctx, (char*)out_buf.buf + output_pos,
+                                                                      &output_written, input_pos, &input_read, &opt));
+        }
+        output_pos += output_written;
+        input_pos += input_read;
+        input_remaining -= input_read;
+        if (!input_size_hint) {
+            break;
+        }
+
+        // destination full
+        if (output_pos == (size_t)out_buf.len) {
+            if (!resizable) {
+                PyErr_SetString(PyExc_ValueError, "out too small");
+                goto bail;
+            }
+            // uncompressed size is always at least that of compressed
+            PyBuffer_Release(&out_buf);
+            BAIL_ON_NONZERO(_acquire_out_buffer(out, &out_buf, MAX(output_pos * 2, (size_t)input.len)));
+        // insufficient data
+        } else if (!input_remaining) {
+            PyErr_SetString(PyExc_ValueError, "frame incomplete");
+            goto bail;
+        }
+    }
+    _release_oneshot_dctx(ctx, block_id);
+    ctx = NULL;
+
+    input_len = input.len;
+    PyBuffer_Release(&input);
+    input_held = 0;
+    BAIL_ON_NONZERO(_release_out_buffer(out, &out_buf, output_pos));
+
+    return Py_BuildValue("nn", (Py_ssize_t)output_pos, input_len - (Py_ssize_t)input_remaining);
+
+bail:
+    if (input_held) {
+        PyBuffer_Release(&input);
+    }
+    PyBuffer_Release(&out_buf);
+    _release_oneshot_dctx(ctx, block_id);
     return NULL;
 }
 
@@ -558,6 +941,41 @@ bail:
 
 /******************************************************************************/
 
+PyDoc_STRVAR(_lz4framed_reset_decompression_context__doc__,
+"reset_decompression_context(ctx)\n"
+"\n"
+"Returns decompression context to its initial state, so it can be used to\n"
+"decompress a new frame, e.g. after a previous one failed to decompress.\n"
+"\n"
+"Args:\n"
+"    ctx: Decompression context\n");
+#define FUNC_DEF_RESET_DCTX {"reset_decompression_context", (PyCFunction)_lz4framed_reset_decompression_context, METH_O,\
+                             _lz4framed_reset_decompression_context__doc__}
+static PyObject*
+_lz4framed_reset_decompression_context(PyObject *self, PyObject *arg) {
+    _lz4f_dctx_t *dctx = NULL;
+    LZ4FRAMED_LOCK_FLAG;
+    UNUSED(self);
+
+    if (!PyCapsule_IsValid(arg, DECOMPRESSION_CAPSULE_NAME)) {
+        PyErr_SetString(PyExc_ValueError, "ctx invalid");
+        goto bail;
+    }
+    // Guaranteed to succeed due to PyCapsule_IsValid check above
+    dctx = PyCapsule_GetPointer(arg, DECOMPRESSION_CAPSULE_NAME);
+
+    ENTER_LZ4FRAMED(dctx);
+    LZ4F_resetDecompressionContext(dctx->ctx);
+    EXIT_LZ4FRAMED(dctx);
+
+    Py_RETURN_NONE;
+
+bail:
+    return NULL;
+}
+
+/******************************************************************************/
+
 PyDoc_STRVAR(_lz4framed_compress_begin__doc__,
 "compress_begin(ctx, block_size_id=LZ4F_BLOCKSIZE_DEFAULT, block_mode_linked=True,\n"
 "               checksum=False, autoflush=False, level=0, block_checksum=False) -> bytes\n"
@@ -651,7 +1069,7 @@ bail:
 /******************************************************************************/
 
 PyDoc_STRVAR(_lz4framed_compress_update__doc__,
-"compress_update(ctx, b) -> bytes\n"
+"compress_update(ctx, b, prepend=None) -> bytes\n"
 "\n"
 "Compresses and returns the given data. Note: return can be zero-length if autoflush\n"
 "parameter is not set via compress_begin(). Once all data has been compressed,\n"
@@ -660,22 +1078,26 @@ PyDoc_STRVAR(_lz4framed_compress_update__doc__,
 "Args:\n"
 "    ctx: Compression context\n"
 "    b (bytes-like object): The object containing lz4-framed data to decompress\n"
+"    prepend (bytes-like object): Data to place in front of the compressed output,\n"
+"                                 e.g. frame header from compress_begin(). This\n"
+"                                 avoids having to concatenate the two afterwards.\n"
 "\n"
 "Raises:\n"
 "    LZ4FNoDataError: If provided data is of zero length. (Useful for ending compression loop.)\n"
 "    Lz4FramedError: If a compression failure occured");
-#define FUNC_DEF_COMPRESS_UPDATE {"compress_update", (PyCFunction)_lz4framed_compress_update, METH_VARARGS,\
-                                  _lz4framed_compress_update__doc__}
+// Called once per block, hence vectorcall (avoids building argument tuple & dict)
+#define FUNC_DEF_COMPRESS_UPDATE {"compress_update", (PyCFunction)(void(*)(void))_lz4framed_compress_update,\
+                                  METH_FASTCALL | METH_KEYWORDS, _lz4framed_compress_update__doc__}
 static PyObject*
-_lz4framed_compress_update(PyObject *self, PyObject *args) {
-#if PY_MAJOR_VERSION >= 3
-    static const char *format = "Oy*:compress_update";
-#else
-    static const char *format = "Os*:compress_update";
-#endif
+_lz4framed_compress_update(PyObject *self, PyObject *const *args, Py_ssize_t nargs, PyObject *kwnames) {
+    static const char *const keywords[] = {"ctx", "b", "prepend", NULL};
+    PyObject *values[] = {NULL, NULL, Py_None};
+
     _lz4f_cctx_t *cctx = NULL;
     PyObject *ctx_capsule;
     Py_buffer input;
+    Py_buffer prepend = {NULL, NULL}; // zero-length unless supplied, safe to release in either case
+    PyObject *prepend_obj;
     int input_held = 0; // whether Py_buffer (input) needs to be released
     PyObject *output = NULL;
     char *output_str;
@@ -683,13 +1105,18 @@ _lz4framed_compress_update(PyObject *self, PyObject *args) {
     LZ4FRAMED_LOCK_FLAG;
     UNUSED(self);
 
-    if (!PyArg_ParseTuple(args, format, &ctx_capsule, &input)) {
-        goto bail;
-    }
+    BAIL_ON_NONZERO(_parse_fastcall_args("compress_update", args, nargs, kwnames, keywords, 2, 2, values));
+    ctx_capsule = values[0];
+    prepend_obj = values[2];
+    BAIL_ON_NONZERO(PyObject_GetBuffer(values[1], &input, PyBUF_SIMPLE));
+    input_held = 1;
     if (!PyCapsule_IsValid(ctx_capsule, COMPRESSION_CAPSULE_NAME)) {
         PyErr_SetString(PyExc_ValueError, "ctx invalid");
         goto bail;
     }
+    if (Py_None != prepend_obj) {
+        BAIL_ON_NONZERO(PyObject_GetBuffer(prepend_obj, &prepend, PyBUF_SIMPLE));
+    }
     if (!PyBuffer_IsContiguous(&input, 'C')) {
         PyErr_SetString(PyExc_ValueError, "input not contiguous");
         goto bail;
@@ -704,8 +1131,12 @@ _lz4framed_compress_update(PyObject *self, PyObject *args) {
     ENTER_LZ4FRAMED(cctx);
 
     BAIL_ON_LZ4_ERROR(output_len = LZ4F_compressBound(input.len, &(cctx->prefs)));
-    BAIL_ON_NULL(output = PyBytes_FromStringAndSize(NULL, output_len));
+    BAIL_ON_NULL(output = PyBytes_FromStringAndSize(NULL, prepend.len + output_len));
     BAIL_ON_NULL(output_str = PyBytes_AsString(output));
+    if (prepend.len) {
+        memcpy(output_str, prepend.buf, prepend.len);
+        output_str += prepend.len;
+    }
 
     if (input.len < NOGIL_COMPRESS_INPUT_SIZE_THRESHOLD) {
         BAIL_ON_LZ4_ERROR(output_len = LZ4F_compressUpdate(cctx->ctx, output_str, output_len, input.buf, input.len,
@@ -715,8 +1146,9 @@ _lz4framed_compress_update(PyObject *self, PyObject *args) {
                                                                  input.len, NULL));
     }
     EXIT_LZ4FRAMED(cctx);
-    BAIL_ON_NONZERO(_PyBytes_Resize(&output, output_len));
+    BAIL_ON_NONZERO(_PyBytes_Resize(&output, prepend.len + output_len));
     PyBuffer_Release(&input);
+    PyBuffer_Release(&prepend);
     input_held = 0;
     return output;
 
@@ -725,6 +1157,7 @@ bail:
     if (input_held) {
         PyBuffer_Release(&input);
     }
+    PyBuffer_Release(&prepend);
     Py_XDECREF(output);
     return NULL;
 }
@@ -768,8 +1201,12 @@ _lz4framed_compress_end(PyObject *self, PyObject *arg) {
     BAIL_ON_NULL(output = PyBytes_FromStringAndSize(NULL, output_len));
     BAIL_ON_NULL(output_str = PyBytes_AsString(output));
 
-    // not worth releasing GIL since should have less than a block left to write
-    BAIL_ON_LZ4_ERROR(output_len = LZ4F_compressEnd(cctx->ctx, output_str, output_len, NULL));
+    // Without autoflush up to a whole block might still be buffered, so release GIL unless block is small
+    if (cctx->prefs.autoFlush || output_len < NOGIL_COMPRESS_INPUT_SIZE_THRESHOLD) {
+        BAIL_ON_LZ4_ERROR(output_len = LZ4F_compressEnd(cctx->ctx, output_str, output_len, NULL));
+    } else {
+        BAIL_ON_LZ4_ERROR_NOGIL(output_len = LZ4F_compressEnd(cctx->ctx, output_str, output_len, NULL));
+    }
 
     EXIT_LZ4FRAMED(cctx);
 
@@ -859,7 +1296,7 @@ bail:
 /******************************************************************************/
 
 PyDoc_STRVAR(_lz4framed_decompress_update__doc__,
-"decompress_update(ctx, b, chunk_len=65536) -> list\n"
+"decompress_update(ctx, b, chunk_len=65536, out=None) -> list\n"
 "\n"
 "Decompresses parts of an lz4 frame from data given in *b*, returning the\n"
 "uncompressed result as a list of chunks, with the last element being input_hint\n"
@@ -872,20 +1309,28 @@ PyDoc_STRVAR(_lz4framed_decompress_update__doc__,
 "    chunk_len (int): Size of uncompressed chunks in bytes. If not all of the\n"
 "                     data fits in one chunk, multiple will be used. Ideally\n"
 "                     only one chunk is required per call of this method - this can\n"
-"                     be determined from block_size_id via get_frame_info() call."
+"                     be determined from block_size_id via get_frame_info() call.\n"
+"    out (writable bytes-like object): If set, uncompressed data is written into this\n"
+"                     buffer instead (and chunk_len is ignored). The returned chunk\n"
+"                     is then a memoryview of (the start of) out rather than a new\n"
+"                     bytes object, i.e. it will be overwritten if out is re-used.\n"
+"                     The buffer must be large enough to hold the uncompressed data\n"
+"                     for the supplied input. When supplying input_hint bytes at a\n"
+"                     time, with the first call supplying no more than the frame\n"
+"                     header (e.g. 7 bytes, the minimum header size), this is at most\n"
+"                     one block, i.e. a buffer of block size (see above) is sufficient.\n"
 "\n"
 "Raises:\n"
-"    Lz4FramedError: If a decompression failure occured");
-#define FUNC_DEF_DECOMPRESS_UPDATE {"decompress_update", (PyCFunction)_lz4framed_decompress_update,\
-                                    METH_VARARGS | METH_KEYWORDS, _lz4framed_decompress_update__doc__}
+"    Lz4FramedError: If a decompression failure occured\n"
+"    ValueError: If out is too small");
+// Called once per block, hence vectorcall (avoids building argument tuple & dict)
+#define FUNC_DEF_DECOMPRESS_UPDATE {"decompress_update", (PyCFunction)(void(*)(void))_lz4framed_decompress_update,\
+                                    METH_FASTCALL | METH_KEYWORDS, _lz4framed_decompress_update__doc__}
 static PyObject*
-_lz4framed_decompress_update(PyObject *self, PyObject *args, PyObject *kwargs) {
-#if PY_MAJOR_VERSION >= 3
-    static const char *format = "Oy*|i:decompress_update";
-#else
-    static const char *format = "Os*|i:decompress_update";
-#endif
-    static char *keywords[] = {"ctx", "b", "chunk_len", NULL};
+_lz4framed_decompress_update(PyObject *self, PyObject *const *args, Py_ssize_t nargs, PyObject *kwnames) {
+    static const char *const keywords[] = {"ctx", "b", "chunk_len", "out", NULL};
+    PyObject *values[] = {NULL, NULL, NULL, Py_None};
+    int chunk_len_arg = 65536;
 
     _lz4f_dctx_t *dctx = NULL;
     PyObject *dctx_capsule;
@@ -895,19 +1340,27 @@ _lz4framed_decompress_update(PyObject *self, PyObject *args, PyObject *kwargs) {
     size_t input_remaining;          // bytes remaining in input
     size_t input_read;               // used by LZ4 functions to indicate how many bytes were / can be read
     size_t input_size_hint = 1;      // LZ4 hint to how many bytes make up the remaining block + next header
-    size_t chunk_len = 65536;        // size of chunks
+    size_t chunk_len;                // size of chunks
     PyObject *list = NULL;           // function return
     PyObject *size_hint = NULL;      // python object of input_size_hint
     PyObject *chunk = NULL ;
     char *chunk_pos = NULL ;         // position in current chunk
     size_t chunk_remaining;          // space remaining in chunk
     size_t chunk_written;            // used by lz4 to indicate how much has been written
+    PyObject *out;                   // optional caller-supplied output buffer
+    Py_buffer out_buf = {NULL, NULL};
+    PyObject *out_view = NULL;
     LZ4FRAMED_LOCK_FLAG;
     UNUSED(self);
 
-    if (!PyArg_ParseTupleAndKeywords(args, kwargs, format, keywords, &dctx_capsule, &input, &chunk_len)) {
-        goto bail;
+    BAIL_ON_NONZERO(_parse_fastcall_args("decompress_update", args, nargs, kwnames, keywords, 0, 2, values));
+    dctx_capsule = values[0];
+    out = values[3];
+    if (NULL != values[2]) {
+        BAIL_ON_NONZERO(_parse_int_arg(values[2], &chunk_len_arg));
     }
+    BAIL_ON_NONZERO(PyObject_GetBuffer(values[1], &input, PyBUF_SIMPLE));
+    input_held = 1;
     if (!PyCapsule_IsValid(dctx_capsule, DECOMPRESSION_CAPSULE_NAME)) {
         PyErr_SetString(PyExc_ValueError, "ctx invalid");
         goto bail;
@@ -920,10 +1373,18 @@ _lz4framed_decompress_update(PyObject *self, PyObject *args, PyObject *kwargs) {
         PyErr_SetNone(LZ4FNoDataError);
         goto bail;
     }
-    if (chunk_len <= 0) {
+    if (chunk_len_arg <= 0) {
         PyErr_SetString(PyExc_ValueError, "chunk_len invalid");
         goto bail;
     }
+    chunk_len = chunk_len_arg;
+    if (Py_None != out) {
+        BAIL_ON_NONZERO(PyObject_GetBuffer(out, &out_buf, PyBUF_WRITABLE));
+        if (out_buf.len <= 0) {
+            PyErr_SetString(PyExc_ValueError, "out invalid");
+            goto bail;
+        }
+    }
     // Guaranteed to succeed due to PyCapsule_IsValid check above
     dctx = PyCapsule_GetPointer(dctx_capsule, DECOMPRESSION_CAPSULE_NAME);
 
@@ -934,15 +1395,21 @@ _lz4framed_decompress_update(PyObject *self, PyObject *args, PyObject *kwargs) {
     BAIL_ON_NULL(list = PyList_New(0));
 
     // first chunk
-    BAIL_ON_NULL(chunk = PyBytes_FromStringAndSize(NULL, chunk_len));
-    BAIL_ON_NULL(chunk_pos = PyBytes_AsString(chunk));
+    if (out_buf.obj) {
+        chunk_pos = out_buf.buf;
+        chunk_len = out_buf.len;
+    } else {
+        BAIL_ON_NULL(chunk = PyBytes_FromStringAndSize(NULL, chunk_len));
+        BAIL_ON_NULL(chunk_pos = PyBytes_AsString(chunk));
+    }
     chunk_written = chunk_remaining = chunk_len;
 
     ENTER_LZ4FRAMED(dctx);
 
     while (input_remaining && input_size_hint) {
-        // add another chunk for more data when current one full
-        if (!chunk_remaining) {
+        // add another chunk for more data when current one full. (With out, decompression continues with zero space
+        // since remaining input, e.g. block checksum & next block header, might not produce any output.)
+        if (!chunk_remaining && !out_buf.obj) {
             // append previous (full) chunk to list
             BAIL_ON_NONZERO(PyList_Append(list, chunk));
             Py_CLEAR(chunk);
@@ -958,6 +1425,11 @@ _lz4framed_decompress_update(PyObject *self, PyObject *args, PyObject *kwargs) {
             BAIL_ON_LZ4_ERROR_NOGIL(input_size_hint = LZ4F_decompress(dctx->ctx, chunk_pos, &chunk_written, input_pos,
                                                                       &input_read, NULL));
         }
+        // no progress (only possible with out being full), i.e. more output space needed
+        if (!input_read && !chunk_written) {
+            PyErr_SetString(PyExc_ValueError, "out too small");
+            goto bail;
+        }
         chunk_pos += chunk_written;
         chunk_written = chunk_remaining = (chunk_remaining - chunk_written);
         input_pos += input_read;
@@ -968,7 +1440,12 @@ _lz4framed_decompress_update(PyObject *self, PyObject *args, PyObject *kwargs) {
 
     // append & reduce size of final chunk (if contains any data)
     if (chunk_remaining < chunk_len) {
-        BAIL_ON_NONZERO(_PyBytes_Resize(&chunk, chunk_len - chunk_remaining));
+        if (out_buf.obj) {
+            BAIL_ON_NULL(out_view = PyMemoryView_FromObject(out));
+            BAIL_ON_NULL(chunk = PySequence_GetSlice(out_view, 0, chunk_len - chunk_remaining));
+        } else {
+            BAIL_ON_NONZERO(_PyBytes_Resize(&chunk, chunk_len - chunk_remaining));
+        }
         BAIL_ON_NONZERO(PyList_Append(list, chunk));
     }
     // append input size hint to list
@@ -976,6 +1453,8 @@ _lz4framed_decompress_update(PyObject *self, PyObject *args, PyObject *kwargs) {
     BAIL_ON_NONZERO(PyList_Append(list, size_hint));
     PyBuffer_Release(&input);
     input_held = 0;
+    PyBuffer_Release(&out_buf);
+    Py_CLEAR(out_view);
     Py_CLEAR(chunk);
     Py_CLEAR(size_hint);
 
@@ -986,6 +1465,8 @@ bail:
     if (input_held) {
         PyBuffer_Release(&input);
     }
+    PyBuffer_Release(&out_buf);
+    Py_XDECREF(out_view);
     Py_XDECREF(chunk);
     Py_XDECREF(size_hint);
     Py_XDECREF(list);
@@ -993,12 +1474,372 @@ bail:
 }
 
 
+/******************************************************************************/
+
+/* Reads until count bytes have been read or end of file is reached. Returns number of bytes read or -1 on failure (with
+ * errno set). Called without GIL.
+ */
+static Py_ssize_t _fd_read_fully(int fd, char *buf, size_t count) {
+    size_t total = 0;
+    Py_ssize_t result;
+
+    while (total < count) {
+        result = FD_READ(fd, buf + total, count - total);
+        if (result < 0) {
+            if (EINTR == errno) {
+                continue;
+            }
+            return -1;
+        }
+        if (0 == result) {
+            break;
+        }
+        total += result;
+    }
+    return total;
+}
+
+#ifdef FD_MMAP_SUPPORTED
+/* Maps remainder of fd (from its current offset) if it refers to a non-empty regular file, so that input does not have
+ * to be copied into a separate buffer. Returns start of mapping (with map_len & data_offset set) or NULL if the file
+ * cannot be mapped, in which case it should be read instead.
+ */
+static char* _fd_map_remaining(int fd, size_t *map_len, size_t *data_offset) {
+    struct stat st;
+    off_t pos;
+    off_t map_start;
+    long page_size = sysconf(_SC_PAGESIZE);
+    char *map;
+
+    if (page_size <= 0 || fstat(fd, &st) || !S_ISREG(st.st_mode) || (pos = lseek(fd, 0, SEEK_CUR)) < 0 ||
+            pos >= st.st_size) {
+        return NULL;
+    }
+    map_start = pos - (pos % page_size);
+    if ((unsigned long long)(st.st_size - map_start) > SIZE_MAX) {
+        return NULL;
+    }
+    *map_len = (size_t)(st.st_size - map_start);
+    *data_offset = (size_t)(pos - map_start);
+    if (MAP_FAILED == (map = mmap(NULL, *map_len, PROT_READ, MAP_PRIVATE, fd, map_start))) {
+        return NULL;
+    }
+#ifdef POSIX_MADV_SEQUENTIAL
+    posix_madvise(map, *map_len, POSIX_MADV_SEQUENTIAL);
+#endif
+    return map;
+}
+#endif
+
+// Returns zero on success or -1 on failure (with errno set). Called without GIL.
+static int _fd_write_fully(int fd, const char *buf, size_t count) {
+    Py_ssize_t result;
+
+    while (count) {
+        result = FD_WRITE(fd, buf, count);
+        if (result < 0) {
+            if (EINTR == errno) {
+                continue;
+            }
+            return -1;
+        }
+        buf += result;
+        count -= result;
+    }
+    return 0;
+}
+
+/******************************************************************************/
+
+PyDoc_STRVAR(_lz4framed_compress_fd__doc__,
+"compress_fd(in_fd, out_fd, block_size_id=LZ4F_BLOCKSIZE_DEFAULT, block_mode_linked=True,\n"
+"            checksum=False, level=0, block_checksum=False)\n"
+"\n"
+"Compresses all data read from file descriptor in_fd into a single lz4 frame, writing\n"
+"it to file descriptor out_fd. The GIL is released whilst reading, compressing and\n"
+"writing each block. If in_fd refers to a regular file, it is memory-mapped (where\n"
+"supported) rather than read, so the file must not be truncated during compression.\n"
+"\n"
+"Args:\n"
+"    in_fd (int): File descriptor to read uncompressed data from (until end of file)\n"
+"    out_fd (int): File descriptor to write lz4 frame to\n"
+"    block_size_id (int): Compression block size identifier, one of the\n"
+"                         LZ4F_BLOCKSIZE_* constants. This also determines the read size.\n"
+"    block_mode_linked (bool): Whether compression blocks are linked\n"
+"    checksum (bool): Whether to produce frame checksum\n"
+"    level (int): Compression level. Values lower than LZ4F_COMPRESSION_MIN_HC (including\n"
+"                 negative ones) use fast compression. Recommended range for hc compression\n"
+"                 is between 4 and 9, with a maximum of LZ4F_COMPRESSION_MAX.\n"
+"    block_checksum (bool): Whether to produce checksum after each block.\n"
+"\n"
+"Raises:\n"
+"    IOError: If reading or writing fails\n"
+"    Lz4FramedError: If a compression failure occured");
+#define FUNC_DEF_COMPRESS_FD {"compress_fd", (PyCFunction)_lz4framed_compress_fd, METH_VARARGS | METH_KEYWORDS,\
+                              _lz4framed_compress_fd__doc__}
+static PyObject*
+_lz4framed_compress_fd(PyObject *self, PyObject *args, PyObject *kwargs) {
+    static const char *format = "ii|iiiii:compress_fd";
+    static char *keywords[] = {"in_fd", "out_fd", "block_size_id", "block_mode_linked", "checksum", "level",
+                               "block_checksum", NULL};
+
+    LZ4F_cctx *ctx = NULL;
+    LZ4F_preferences_t prefs = prefs_defaults;
+    int in_fd;
+    int out_fd;
+    int block_id = LZ4F_default;
+    int block_mode_linked = 1;
+    int block_checksum = 0;
+    int checksum = 0;
+    int compression_level = LZ4_COMPRESSION_MIN;
+    char *input = NULL;
+    const char *block = NULL;
+    size_t input_len;
+    Py_ssize_t input_read;
+    char *output = NULL;
+    size_t output_len;
+    size_t output_written;
+    int write_failed;
+    char *map = NULL;
+    size_t map_len = 0;
+    size_t map_pos = 0;
+    size_t map_data_offset = 0;
+    UNUSED(self);
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, format, keywords, &in_fd, &out_fd, &block_id, &block_mode_linked,
+                                     &checksum, &compression_level, &block_checksum)) {
+        goto bail;
+    }
+    if (!_valid_lz4f_block_size_id(block_id)) {
+        PyErr_Format(PyExc_ValueError, "block_size_id (%d) invalid", block_id);
+        goto bail;
+    }
+    if (compression_level > LZ4_COMPRESSION_MAX) {
+        PyErr_Format(PyExc_ValueError, "level (%d) invalid", compression_level);
+        goto bail;
+    }
+
+    prefs.frameInfo.blockMode = block_mode_linked ? LZ4F_blockLinked : LZ4F_blockIndependent;
+    prefs.frameInfo.blockSizeID = block_id;
+    prefs.frameInfo.blockChecksumFlag = block_checksum ? LZ4F_blockChecksumEnabled : LZ4F_noBlockChecksum;
+    prefs.frameInfo.contentChecksumFlag = checksum ? LZ4F_contentChecksumEnabled : LZ4F_noContentChecksum;
+    prefs.compressionLevel = compression_level;
+
+    // buffers are only allocated once for the whole frame
+    input_len = _lz4f_block_size_from_id(block_id);
+    BAIL_ON_LZ4_ERROR(output_len = LZ4F_compressBound(input_len, &prefs));
+    output_len = MAX(output_len, LZ4F_HEADER_SIZE_MAX);
+#ifdef FD_MMAP_SUPPORTED
+    map = _fd_map_remaining(in_fd, &map_len, &map_data_offset);
+    map_pos = map_data_offset;
+#endif
+    if ((NULL == map && NULL == (input = PyMem_Malloc(input_len))) || NULL == (output = PyMem_Malloc(output_len))) {
+        PyErr_NoMemory();
+        goto bail;
+    }
+    BAIL_ON_LZ4_ERROR(LZ4F_createCompressionContext(&ctx, LZ4F_VERSION));
+
+    BAIL_ON_LZ4_ERROR(output_written = LZ4F_compressBegin(ctx, output, output_len, &prefs));
+    do {
+        write_failed = 0;
+        Py_BEGIN_ALLOW_THREADS;
+        if (output_written) {
+            write_failed = _fd_write_fully(out_fd, output, output_written);
+        }
+        output_written = 0;
+        if (write_failed) {
+            input_read = 0;
+        } else if (map) {
+            // compress directly from mapped file
+            block = map + map_pos;
+            input_read = MIN(input_len, map_len - map_pos);
+            map_pos += input_read;
+        } else {
+            block = input;
+            input_read = _fd_read_fully(in_fd, input, input_len);
+        }
+        if (input_read > 0) {
+            output_written = LZ4F_compressUpdate(ctx, output, output_len, block, input_read, NULL);
+        }
+        Py_END_ALLOW_THREADS;
+
+        if (write_failed || input_read < 0) {
+            PyErr_SetFromErrno(PyExc_IOError);
+            goto bail;
+        }
+        BAIL_ON_LZ4_ERROR(output_written);
+        BAIL_ON_NONZERO(PyErr_CheckSignals());
+    } while (input_read > 0);
+
+    // should have less than a block left to write
+    BAIL_ON_LZ4_ERROR(output_written = LZ4F_compressEnd(ctx, output, output_len, NULL));
+    Py_BEGIN_ALLOW_THREADS;
+    write_failed = _fd_write_fully(out_fd, output, output_written);
+    Py_END_ALLOW_THREADS;
+    if (write_failed) {
+        PyErr_SetFromErrno(PyExc_IOError);
+        goto bail;
+    }
+#ifdef FD_MMAP_SUPPORTED
+    if (map) {
+        munmap(map, map_len);
+        map = NULL;
+        // leave file offset as if input had been read
+        if (lseek(in_fd, (off_t)(map_pos - map_data_offset), SEEK_CUR) < 0) {
+            PyErr_SetFromErrno(PyExc_IOError);
+            goto bail;
+        }
+    }
+#endif
+
+    LZ4F_freeCompressionContext(ctx);
+    PyMem_Free(input);
+    PyMem_Free(output);
+    Py_RETURN_NONE;
+
+bail:
+#ifdef FD_MMAP_SUPPORTED
+    if (map) {
+        munmap(map, map_len);
+    }
+#endif
+    LZ4F_freeCompressionContext(ctx);
+    PyMem_Free(input);
+    PyMem_Free(output);
+    return NULL;
+}
+
+/******************************************************************************/
+
+PyDoc_STRVAR(_lz4framed_decompress_fd__doc__,
+"decompress_fd(in_fd, out_fd)\n"
+"\n"
+"Decompresses a single lz4 frame read from file descriptor in_fd, writing the\n"
+"uncompressed data to file descriptor out_fd. No more than the frame itself is read\n"
+"from in_fd. The GIL is released whilst reading, decompressing and writing each block.\n"
+"\n"
+"Args:\n"
+"    in_fd (int): File descriptor to read lz4 frame from\n"
+"    out_fd (int): File descriptor to write uncompressed data to\n"
+"\n"
+"Raises:\n"
+"    IOError: If reading or writing fails\n"
+"    LZ4FNoDataError: If end of file is reached before the frame is complete\n"
+"    Lz4FramedError: If a decompression failure occured");
+#define FUNC_DEF_DECOMPRESS_FD {"decompress_fd", (PyCFunction)_lz4framed_decompress_fd, METH_VARARGS | METH_KEYWORDS,\
+                                _lz4framed_decompress_fd__doc__}
+static PyObject*
+_lz4framed_decompress_fd(PyObject *self, PyObject *args, PyObject *kwargs) {
+    static const char *format = "ii:decompress_fd";
+    static char *keywords[] = {"in_fd", "out_fd", NULL};
+
+    LZ4F_dctx *ctx = NULL;
+    LZ4F_frameInfo_t frame_info;
+    int frame_info_known = 0;
+    int in_fd;
+    int out_fd;
+    char *input = NULL;
+    char *input_pos;
+    size_t input_len = 0;
+    size_t input_size_hint = LZ4F_HEADER_SIZE_MIN; // how many bytes to read next
+    Py_ssize_t input_read;
+    size_t input_remaining;
+    size_t input_consumed;
+    char *output = NULL;
+    size_t output_len = 64 KB;      // increased to block size once known
+    size_t output_written;
+    size_t zero = 0;
+    size_t result;
+    int write_failed;
+    UNUSED(self);
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, format, keywords, &in_fd, &out_fd)) {
+        goto bail;
+    }
+    if (NULL == (output = PyMem_Malloc(output_len))) {
+        PyErr_NoMemory();
+        goto bail;
+    }
+    BAIL_ON_LZ4_ERROR(LZ4F_createDecompressionContext(&ctx, LZ4F_VERSION));
+
+    while (input_size_hint) {
+        if (input_size_hint > input_len) {
+            PyMem_Free(input);
+            input_len = input_size_hint;
+            if (NULL == (input = PyMem_Malloc(input_len))) {
+                PyErr_NoMemory();
+                goto bail;
+            }
+        }
+        result = 0;
+        write_failed = 0;
+
+        Py_BEGIN_ALLOW_THREADS;
+        input_read = _fd_read_fully(in_fd, input, input_size_hint);
+        input_pos = input;
+        input_remaining = (input_read > 0) ? input_read : 0;
+        // output buffer might not be large enough for all of input
+        while (input_remaining && !write_failed) {
+            output_written = output_len;
+            input_consumed = input_remaining;
+            result = LZ4F_decompress(ctx, output, &output_written, input_pos, &input_consumed, NULL);
+            if (LZ4F_isError(result)) {
+                break;
+            }
+            input_pos += input_consumed;
+            input_remaining -= input_consumed;
+            if (output_written) {
+                write_failed = _fd_write_fully(out_fd, output, output_written);
+            }
+        }
+        Py_END_ALLOW_THREADS;
+
+        if (write_failed || input_read < 0) {
+            PyErr_SetFromErrno(PyExc_IOError);
+            goto bail;
+        }
+        if (0 == input_read) {
+            PyErr_SetNone(LZ4FNoDataError);
+            goto bail;
+        }
+        BAIL_ON_LZ4_ERROR(result);
+        // end of file, if fewer than requested bytes were read, will be detected on next read
+        input_size_hint = result;
+
+        if (!frame_info_known && !LZ4F_isError(LZ4F_getFrameInfo(ctx, &frame_info, NULL, &zero))) {
+            frame_info_known = 1;
+            // avoid having to decompress a block in multiple steps
+            if (_lz4f_block_size_from_id(frame_info.blockSizeID) > output_len) {
+                PyMem_Free(output);
+                output_len = _lz4f_block_size_from_id(frame_info.blockSizeID);
+                if (NULL == (output = PyMem_Malloc(output_len))) {
+                    PyErr_NoMemory();
+                    goto bail;
+                }
+            }
+        }
+        BAIL_ON_NONZERO(PyErr_CheckSignals());
+    }
+
+    LZ4F_freeDecompressionContext(ctx);
+    PyMem_Free(input);
+    PyMem_Free(output);
+    Py_RETURN_NONE;
+
+bail:
+    LZ4F_freeDecompressionContext(ctx);
+    PyMem_Free(input);
+    PyMem_Free(output);
+    return NULL;
+}
+
 /******************************************************************************/
 
 static PyMethodDef Lz4framedMethods[] = {
-    FUNC_DEF_GET_BLOCK_SIZE, FUNC_DEF_COMPRESS, FUNC_DEF_DECOMPRESS, FUNC_DEF_CREATE_CCTX, FUNC_DEF_CREATE_DCTX,
+    FUNC_DEF_GET_BLOCK_SIZE, FUNC_DEF_COMPRESS, FUNC_DEF_DECOMPRESS, FUNC_DEF_COMPRESS_INTO, FUNC_DEF_DECOMPRESS_INTO,
+    FUNC_DEF_CREATE_CCTX, FUNC_DEF_CREATE_DCTX,
     FUNC_DEF_COMPRESS_BEGIN, FUNC_DEF_COMPRESS_UPDATE, FUNC_DEF_COMPRESS_END, FUNC_DEF_GET_FRAME_INFO,
-    FUNC_DEF_DECOMPRESS_UPDATE,
+    FUNC_DEF_DECOMPRESS_UPDATE, FUNC_DEF_RESET_DCTX, FUNC_DEF_COMPRESS_FD, FUNC_DEF_DECOMPRESS_FD,
     {NULL, NULL, 0, NULL}
 };
 
@@ -1006,14 +1847,7 @@ struct module_state {
     PyObject *error;
 };
 
-#if PY_MAJOR_VERSION >= 3
 #define GETSTATE(m) ((struct module_state*)PyModule_GetState(m))
-#else
-#define GETSTATE(m) (&_state)
-static struct module_state _state;
-#endif
-
-#if PY_MAJOR_VERSION >= 3
 
 static int myextension_traverse(PyObject *m, visitproc visit, void *arg) {
     Py_VISIT(GETSTATE(m)->error);
@@ -1038,23 +1872,11 @@ static struct PyModuleDef moduledef = {
         NULL
 };
 
-#define INITERROR return NULL
 PyObject*
 PyInit__lz4framed(void)
-
-#else
-#define INITERROR return
-
-void
-init_lz4framed(void)
-#endif
 {
     struct module_state *state = NULL;
-#if PY_MAJOR_VERSION >= 3
     PyObject *module = PyModule_Create(&moduledef);
-#else
-    PyObject *module = Py_InitModule("_lz4framed", Lz4framedMethods);
-#endif
 
     BAIL_ON_NULL(module);
     BAIL_ON_NULL(state = GETSTATE(module));
@@ -1102,15 +1924,11 @@ init_lz4framed(void)
         goto bail;
     }
 
-#if PY_MAJOR_VERSION >= 3
     return module;
-#else
-    return;
-#endif
 
 bail:
     Py_XINCREF(LZ4FError);
     Py_XINCREF(LZ4FNoDataError);
     Py_XDECREF(module);
-    INITERROR;
+    return NULL;
 }
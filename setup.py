@@ -14,8 +14,6 @@
 
 # pylint: disable=import-error,wrong-import-order,ungrouped-imports
 
-from __future__ import print_function
-
 import os
 
 # Allow for environments without setuptools
@@ -35,6 +33,41 @@ def load_description(filename):
 
 VERSION = '0.14.0'
 
+EXTRA_COMPILE_ARGS = [
+    '-Ilz4',
+    '-std=c99',
+    '-DXXH_NAMESPACE=PLZ4F_',
+    '-DVERSION=%s' % VERSION,
+    # For testing only - some of these are GCC-specific
+    # '-Wall',
+    # '-Wextra',
+    # '-Wundef',
+    # '-Wshadow',
+    # '-Wcast-align',
+    # '-Wcast-qual',
+    # '-Wstrict-prototypes',
+    # '-pedantic'
+]
+EXTRA_LINK_ARGS = []
+
+# Optionally optimise for a specific CPU (GCC/Clang only), e.g. PY_LZ4FRAMED_ARCH=native. The resulting extension
+# might not run on other machines, so this must not be used for distributable builds.
+ARCH = os.environ.get('PY_LZ4FRAMED_ARCH')
+if ARCH:
+    EXTRA_COMPILE_ARGS += ['-O3', '-flto', '-march=%s' % ARCH]
+    EXTRA_LINK_ARGS += ['-O3', '-flto']
+
+# Optionally change size of hash table used by fast (non-hc) compression to 2^N bytes (lz4 default: 14, i.e. 16KiB).
+# Larger tables improve ratio but every compression context (including pooled ones) holds one. Tables are allocated on
+# the heap since they could otherwise be too large for the stack.
+MEMORY_USAGE = os.environ.get('PY_LZ4FRAMED_MEMORY_USAGE')
+if MEMORY_USAGE:
+    MEMORY_USAGE = int(MEMORY_USAGE)
+    # lz4frame re-uses the (256KiB) hc state for fast compression when a context switches level, so fast state must fit
+    if not 10 <= MEMORY_USAGE <= 17:
+        raise ValueError('PY_LZ4FRAMED_MEMORY_USAGE must be between 10 and 17')
+    EXTRA_COMPILE_ARGS += ['-DLZ4_MEMORY_USAGE=%d' % MEMORY_USAGE, '-DLZ4_HEAPMODE=1', '-DLZ4F_HEAPMODE=1']
+
 setup(
     name='py-lz4framed',
     version=VERSION,
@@ -49,6 +82,7 @@ setup(
     license='Apache License 2.0',
     packages=['lz4framed'],
     zip_safe=False,
+    python_requires='>=3.7',
     ext_modules=[
         Extension('_lz4framed', [
             # lz4 library
@@ -57,21 +91,7 @@ setup(
             'lz4/lz4frame.c',
             'lz4/xxhash.c',
             'lz4framed/py-lz4framed.c',
-        ], extra_compile_args=[
-            '-Ilz4',
-            '-std=c99',
-            '-DXXH_NAMESPACE=PLZ4F_',
-            '-DVERSION=%s' % VERSION,
-            # For testing only - some of these are GCC-specific
-            # '-Wall',
-            # '-Wextra',
-            # '-Wundef',
-            # '-Wshadow',
-            # '-Wcast-align',
-            # '-Wcast-qual',
-            # '-Wstrict-prototypes',
-            # '-pedantic'
-        ])],
+        ], extra_compile_args=EXTRA_COMPILE_ARGS, extra_link_args=EXTRA_LINK_ARGS)],
     keywords=['lz4framed', 'lz4frame', 'lz4'],
     classifiers=[
         'Development Status :: 5 - Production/Stable',
@@ -79,12 +99,8 @@ setup(
         'Intended Audience :: Developers',
         'Programming Language :: C',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 2.7',
-        'Programming Language :: Python :: 3.2',
-        'Programming Language :: Python :: 3.3',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
         'Programming Language :: Python :: 3.7',
         'Topic :: Software Development :: Libraries',
         'Topic :: Software Development :: Libraries :: Python Modules'
@@ -13,39 +13,86 @@
 # limitations under the License.
 
 
-"""Note: These tests are not meant to verify all of lz4's behaviour, only the Python functionality"""
+"""Note: These tests are not meant to verify all of lz4's behaviour, only the Python functionality
 
-from sys import version_info
+Tests are independent of each other and only use immutable or lazily created (per-process) module-level fixtures, so
+they can be run in parallel, e.g.: python3 -m pytest -n auto test.py
+
+Only a representative set of compression levels is tested by default. Set PY_LZ4FRAMED_TEST_ALL_LEVELS=1 to test all
+of them.
+"""
+
+from os import close, pipe, write, environ
 from unittest import TestCase
 from contextlib import contextmanager
-from io import BytesIO, SEEK_END
+from functools import lru_cache
+from gc import collect
+from itertools import product
+from hashlib import blake2b
+from io import BytesIO, RawIOBase
+from random import Random
+from tempfile import TemporaryFile
+from threading import Thread
 
 from lz4framed import (LZ4F_BLOCKSIZE_DEFAULT, LZ4F_BLOCKSIZE_MAX64KB, LZ4F_BLOCKSIZE_MAX256KB, LZ4F_BLOCKSIZE_MAX1MB,
                        LZ4F_BLOCKSIZE_MAX4MB,
-                       LZ4F_COMPRESSION_MAX,
+                       LZ4F_COMPRESSION_MAX, LZ4F_COMPRESSION_MIN_HC,
                        LZ4F_ERROR_GENERIC, LZ4F_ERROR_contentChecksum_invalid, LZ4F_ERROR_frameType_unknown,
                        LZ4F_ERROR_srcPtr_wrong, Lz4FramedError, Lz4FramedNoDataError,
-                       compress, decompress,
+                       compress, decompress, compress_into, decompress_into,
                        create_compression_context, compress_begin, compress_update, compress_end,
-                       create_decompression_context, get_frame_info, decompress_update,
+                       create_decompression_context, get_frame_info, decompress_update, reset_decompression_context,
+                       compress_fd, decompress_fd,
                        get_block_size,
                        Compressor, Decompressor)
-
-PY2 = version_info[0] < 3
+from lz4framed import _release_context, _cctx_pool, _dctx_pool
+from lz4framed import __main__ as command_line
 
 SHORT_INPUT = b'abcdefghijklmnopqrstuvwxyz0123456789'
-LONG_INPUT = SHORT_INPUT * (10**5)
+# Spans several blocks at the default (64KB) block size
+LONG_INPUT = SHORT_INPUT * 9000
+LONG_INPUT_DIGEST = blake2b(LONG_INPUT, digest_size=16).digest()
+# Half repetitive, half (incompressible) random, so that lz4's incompressible data path is also exercised
+MIXED_INPUT = SHORT_INPUT * 50000 + Random(0).getrandbits(1800000 * 8).to_bytes(1800000, 'little')
 LEVEL_ACCELERATED_MAX = -10
+# Input chunk size for streaming tests, i.e. one (default) lz4 block per compression call
+READ_SIZE = get_block_size(LZ4F_BLOCKSIZE_DEFAULT)
+# Upper limit of framing overhead for (compressible) test inputs when preallocating output
+OUTPUT_OVERHEAD = 64 * 1024
+BLOCK_SIZES = (LZ4F_BLOCKSIZE_DEFAULT, LZ4F_BLOCKSIZE_MAX64KB, LZ4F_BLOCKSIZE_MAX256KB, LZ4F_BLOCKSIZE_MAX1MB,
+               LZ4F_BLOCKSIZE_MAX4MB)
+# Maximum block size in bytes for each (non-default) block size id
+EXPECTED_BLOCK_SIZES = {LZ4F_BLOCKSIZE_MAX64KB: 64 * 1024, LZ4F_BLOCKSIZE_MAX256KB: 256 * 1024,
+                        LZ4F_BLOCKSIZE_MAX1MB: 1024 * 1024, LZ4F_BLOCKSIZE_MAX4MB: 4 * 1024 * 1024}
+# Compression levels to test, by default a representative set: accelerated, default & other fast, lowest/highest of
+# regular hc and optimal hc
+if environ.get('PY_LZ4FRAMED_TEST_ALL_LEVELS'):
+    LEVELS = range(LEVEL_ACCELERATED_MAX, LZ4F_COMPRESSION_MAX + 1)
+else:
+    LEVELS = (LEVEL_ACCELERATED_MAX, -1, 0, 1, LZ4F_COMPRESSION_MIN_HC, 9, 10, LZ4F_COMPRESSION_MAX)
+# Invalid frame option arguments (as accepted by compress() & compress_begin()) and the exception each should raise
+INVALID_FRAME_ARGS = (({'block_size_id': '1'}, TypeError), ({'block_size_id': -1}, ValueError),
+                      ({'block_mode_linked': None}, TypeError), ({'checksum': None}, TypeError),
+                      ({'block_checksum': None}, TypeError), ({'level': '1'}, TypeError))
+
+
+@lru_cache(maxsize=None)
+def compressed(data, **kwargs):
+    """Output of compress() for tests which only need (immutable) compressed input, i.e. only compressed once"""
+    return compress(data, **kwargs)
+
+
+@lru_cache(maxsize=None)
+def compressed_streamed(data):
+    """As compressed() but via Compressor, i.e. frame header does not specify content size"""
+    with BytesIO() as out_bytes:
+        with Compressor(out_bytes) as compressor:
+            compressor.update(data)
+        return out_bytes.getvalue()
 
 
 class TestHelperMixin(object):
 
-    def setUp(self):
-        super(TestHelperMixin, self).setUp()
-        if PY2:
-            # avoid deprecation warning
-            self.assertRaisesRegex = self.assertRaisesRegexp  # pylint: disable=invalid-name
-
     def check_compress_short(self, *args, **kwargs):
         self.assertEqual(SHORT_INPUT, decompress(compress(SHORT_INPUT, *args, **kwargs)))
 
@@ -71,46 +118,56 @@ class TestCompress(TestHelperMixin, TestCase):
             compress(b'')
         self.check_compress_short()
 
+    def test_compress_invalid_args(self):
+        for kwargs, exception in INVALID_FRAME_ARGS:
+            with self.subTest(**kwargs), self.assertRaises(exception):
+                compress(SHORT_INPUT, **kwargs)
+
     def test_compress_block_size(self):
-        with self.assertRaises(TypeError):
-            compress(SHORT_INPUT, block_size_id='1')
-        with self.assertRaises(ValueError):
-            compress(SHORT_INPUT, block_size_id=-1)
-        for block_size in (LZ4F_BLOCKSIZE_DEFAULT, LZ4F_BLOCKSIZE_MAX64KB, LZ4F_BLOCKSIZE_MAX256KB,
-                           LZ4F_BLOCKSIZE_MAX1MB, LZ4F_BLOCKSIZE_MAX4MB):
-            self.check_compress_short(block_size_id=block_size)
-            self.check_compress_long(block_size_id=block_size)
+        for block_size in BLOCK_SIZES:
+            with self.subTest(block_size_id=block_size):
+                self.check_compress_short(block_size_id=block_size)
+                # just over two blocks of the given size (rather than fixed-size long input)
+                data = SHORT_INPUT * (2 * get_block_size(block_size) // len(SHORT_INPUT) + 1)
+                self.assertEqual(decompress(compress(data, block_size_id=block_size)), data)
 
     def test_compress_linked_mode(self):
-        with self.assertRaises(TypeError):
-            compress(SHORT_INPUT, block_mode_linked=None)
         self.check_compress_short(block_mode_linked=True)
         self.check_compress_short(block_mode_linked=False)
 
     def test_compress_checksum(self):
-        with self.assertRaises(TypeError):
-            compress(SHORT_INPUT, checksum=None)
         self.check_compress_short(checksum=True)
         self.check_compress_short(checksum=False)
-        for data in (SHORT_INPUT, LONG_INPUT):
-            with self.assertRaisesLz4FramedError(LZ4F_ERROR_contentChecksum_invalid):
-                # invalid checksum
-                decompress(compress(data, checksum=True)[:-1] + b'0')
+
+    def __check_checksum_invalid(self, data):
+        with self.assertRaisesLz4FramedError(LZ4F_ERROR_contentChecksum_invalid):
+            decompress(compressed(data, checksum=True)[:-1] + b'0')
+
+    def test_compress_checksum_invalid_short(self):  # pylint: disable=invalid-name
+        self.__check_checksum_invalid(SHORT_INPUT)
+
+    def test_compress_checksum_invalid_long(self):  # pylint: disable=invalid-name
+        self.__check_checksum_invalid(LONG_INPUT)
 
     def test_compress_block_checksum(self):
-        with self.assertRaises(TypeError):
-            compress(SHORT_INPUT, block_checksum=None)
         self.check_compress_short(block_checksum=True)
         self.check_compress_short(block_checksum=False)
 
+    def test_compress_option_combinations(self):  # pylint: disable=invalid-name
+        for block_size, linked, checksum, block_checksum in product(BLOCK_SIZES, (True, False), (True, False),
+                                                                    (True, False)):
+            kwargs = {'block_size_id': block_size, 'block_mode_linked': linked, 'checksum': checksum,
+                      'block_checksum': block_checksum}
+            with self.subTest(**kwargs):
+                self.check_compress_long(**kwargs)
+
     def test_compress_level(self):
-        with self.assertRaises(TypeError):
-            compress(SHORT_INPUT, level='1')
         # negative values designate accelerattion
-        for level in range(LEVEL_ACCELERATED_MAX, LZ4F_COMPRESSION_MAX + 1):
-            self.check_compress_short(level=level)
-        # large input, fast & hc levels (levels > 10 (v1.7.5) are significantly slower)
-        self.check_compress_long(level=0)
+        for level in LEVELS:
+            with self.subTest(level=level):
+                self.check_compress_short(level=level)
+        # large input at hc level only (default fast level already covered by other tests). Levels > 10 (v1.7.5) are
+        # significantly slower.
         self.check_compress_long(level=10)
 
     def test_compress_memoryview(self):
@@ -128,20 +185,25 @@ class TestDecompress(TestHelperMixin, TestCase):
         self.check_compress_short()
 
     def test_decompress_buffer_size(self):
-        out = compress(SHORT_INPUT)
+        out = compressed(SHORT_INPUT)
         with self.assertRaises(TypeError):
             decompress(out, buffer_size='1')
         with self.assertRaises(ValueError):
             decompress(out, buffer_size=0)
-        out = compress(LONG_INPUT)
-        for buffer_size in range(1, 1025, 128):
-            self.assertEqual(LONG_INPUT, decompress(out, buffer_size=buffer_size))
+        # buffer_size ignored if frame specifies content size
+        self.assertEqual(LONG_INPUT, decompress(compressed(LONG_INPUT), buffer_size=1))
+
+        out = compressed_streamed(LONG_INPUT)
+        # Boundary cases only: smaller than input (i.e. ignored), requiring output to be doubled or resized
+        for buffer_size in (1, len(out) + 1, len(LONG_INPUT) - 1, len(LONG_INPUT), len(LONG_INPUT) + 1):
+            with self.subTest(buffer_size=buffer_size):
+                self.assertEqual(LONG_INPUT, decompress(out, buffer_size=buffer_size))
 
     def test_decompress_invalid_input(self):
         with self.assertRaisesLz4FramedError(LZ4F_ERROR_frameType_unknown):
             decompress(b'invalidheader')
         with self.assertRaisesRegex(ValueError, 'frame incomplete'):
-            decompress(compress(SHORT_INPUT)[:-5])
+            decompress(compressed(SHORT_INPUT)[:-5])
         # incomplete data (length not specified in header)
         with BytesIO() as out:
             with Compressor(out) as compressor:
@@ -151,20 +213,27 @@ class TestDecompress(TestHelperMixin, TestCase):
                 decompress(output[:-20])
 
     def test_decompress_memoryview(self):
-        view = memoryview(compress(LONG_INPUT))
+        view = memoryview(compressed(LONG_INPUT))
         self.assertEqual(LONG_INPUT, decompress(view))
 
 
 class TestLowLevelFunctions(TestHelperMixin, TestCase):
 
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Only for passing to functions expecting the other type of context, i.e. state never changes
+        cls.unused_cctx = create_compression_context()
+        cls.unused_dctx = create_decompression_context()
+
     def test_get_block_size(self):
         with self.assertRaises(TypeError):
             get_block_size('1')
         with self.assertRaises(ValueError):
             get_block_size(1)
         self.assertEqual(get_block_size(), get_block_size(LZ4F_BLOCKSIZE_DEFAULT))
-        for size in (LZ4F_BLOCKSIZE_MAX64KB, LZ4F_BLOCKSIZE_MAX256KB, LZ4F_BLOCKSIZE_MAX1MB, LZ4F_BLOCKSIZE_MAX4MB):
-            self.assertEqual(get_block_size(size), 1 << (8 + (2 * size)))
+        for size, expected in EXPECTED_BLOCK_SIZES.items():
+            self.assertEqual(get_block_size(size), expected)
 
     def test_create_contexts(self):
         for func in (create_compression_context, create_decompression_context):
@@ -174,7 +243,7 @@ class TestLowLevelFunctions(TestHelperMixin, TestCase):
         with self.assertRaises(TypeError):
             get_frame_info()
         with self.assertRaises(ValueError):
-            get_frame_info(create_compression_context())
+            get_frame_info(self.unused_cctx)
 
         ctx = create_decompression_context()
         with self.assertRaisesLz4FramedError(LZ4F_ERROR_srcPtr_wrong):
@@ -184,7 +253,7 @@ class TestLowLevelFunctions(TestHelperMixin, TestCase):
                 'block_size_id': LZ4F_BLOCKSIZE_MAX256KB,
                 'block_mode_linked': False}
         # Using long input since lz4 adjusts block size is input smaller than one block
-        decompress_update(ctx, compress(LONG_INPUT, **args)[:15])
+        decompress_update(ctx, compressed(LONG_INPUT, **args)[:15])
         info = get_frame_info(ctx)
         self.assertTrue(info.pop('input_hint', 0) > 0)
         args['length'] = len(LONG_INPUT)
@@ -200,34 +269,30 @@ class TestLowLevelFunctions(TestHelperMixin, TestCase):
         with self.assertRaises(TypeError):
             compress_begin()
         with self.assertRaises(ValueError):
-            compress_begin(create_decompression_context())
+            compress_begin(self.unused_dctx)
+
+    def test_compress_begin_invalid_args(self):  # pylint: disable=invalid-name
+        for kwargs, exception in INVALID_FRAME_ARGS:
+            with self.subTest(**kwargs), self.assertRaises(exception):
+                self.__compress_begin(**kwargs)
 
     def test_compress_begin_block_size(self):
-        with self.assertRaises(TypeError):
-            self.__compress_begin(block_size_id='1')
-        with self.assertRaises(ValueError):
-            self.__compress_begin(block_size_id=-1)
-        for size in (LZ4F_BLOCKSIZE_DEFAULT, LZ4F_BLOCKSIZE_MAX64KB, LZ4F_BLOCKSIZE_MAX256KB, LZ4F_BLOCKSIZE_MAX1MB,
-                     LZ4F_BLOCKSIZE_MAX4MB):
-            self.__compress_begin(block_size_id=size)
+        for size in BLOCK_SIZES:
+            with self.subTest(block_size_id=size):
+                self.__compress_begin(block_size_id=size)
 
     def test_compress_begin_linked_mode(self):
-        with self.assertRaises(TypeError):
-            self.__compress_begin(block_mode_linked=None)
         self.__compress_begin(block_mode_linked=True)
         self.__compress_begin(block_mode_linked=False)
 
     def test_compress_begin_checksum(self):
-        with self.assertRaises(TypeError):
-            self.__compress_begin(checksum=None)
         self.__compress_begin(checksum=True)
         self.__compress_begin(checksum=False)
 
     def test_compress_begin_level(self):
-        with self.assertRaises(TypeError):
-            self.__compress_begin(level='1')
-        for level in range(LEVEL_ACCELERATED_MAX, LZ4F_COMPRESSION_MAX + 1):
-            self.__compress_begin(level=level)
+        for level in LEVELS:
+            with self.subTest(level=level):
+                self.__compress_begin(level=level)
 
     def test_compress_update_invalid(self):
         with self.assertRaises(TypeError):
@@ -236,15 +301,22 @@ class TestLowLevelFunctions(TestHelperMixin, TestCase):
             compress_update(1)
         # invalid context
         with self.assertRaises(ValueError):
-            compress_update(create_decompression_context(), b' ')
+            compress_update(self.unused_dctx, b' ')
         # data before compress_begin called
         with self.assertRaisesLz4FramedError(LZ4F_ERROR_GENERIC):
             compress_update(create_compression_context(), b' ')
 
         ctx, _ = self.__compress_begin()
+        # only prepend can be given by keyword
+        with self.assertRaises(TypeError):
+            compress_update(ctx, b=b' ')
         # invalid data
         with self.assertRaises(TypeError):
             compress_update(ctx, 1)
+        with self.assertRaises(TypeError):
+            compress_update(ctx, b' ', prepend=1)
+        with self.assertRaises(TypeError):
+            compress_update(ctx, b' ', prepend=' ')
         # empty data
         with self.assertRaises(Lz4FramedNoDataError):
             compress_update(ctx, b'')
@@ -253,7 +325,7 @@ class TestLowLevelFunctions(TestHelperMixin, TestCase):
         with self.assertRaises(TypeError):
             compress_end()
         with self.assertRaises(ValueError):
-            compress_end(create_decompression_context())
+            compress_end(self.unused_dctx)
 
         ctx, header = self.__compress_begin()
         self.assertEqual(b'', decompress(header + compress_end(ctx)))
@@ -262,34 +334,14 @@ class TestLowLevelFunctions(TestHelperMixin, TestCase):
         data = compress_update(ctx, SHORT_INPUT)
         self.assertEqual(decompress(header + data + compress_end(ctx)), SHORT_INPUT)
 
-    def __compress_with_data_and_args(self, data, **kwargs):
-        ctx, header = self.__compress_begin(**kwargs)
-        in_raw = BytesIO(data)
-        out = BytesIO(header)
-        out.seek(0, SEEK_END)
-        try:
-            while True:
-                out.write(compress_update(ctx, in_raw.read(1024)))
-        except Lz4FramedNoDataError:
-            pass
-        out.write(compress_end(ctx))
-        self.assertEqual(decompress(out.getvalue()), data)
-
-    def test_compress(self):
-        func = self.__compress_with_data_and_args
-
-        for size in (LZ4F_BLOCKSIZE_DEFAULT, LZ4F_BLOCKSIZE_MAX64KB, LZ4F_BLOCKSIZE_MAX256KB, LZ4F_BLOCKSIZE_MAX1MB,
-                     LZ4F_BLOCKSIZE_MAX4MB):
-            func(LONG_INPUT, block_size_id=size)
-
-        for arg in ('block_mode_linked', 'checksum'):
-            for value in (False, True):
-                func(LONG_INPUT, **{arg: value})
-
-        for level in range(LEVEL_ACCELERATED_MAX, LZ4F_COMPRESSION_MAX + 1):
-            func(SHORT_INPUT, level=level)
-
-        func(memoryview(LONG_INPUT))
+    def test_compress_update_prepend(self):
+        expected = compress_update(self.__compress_begin(autoflush=True)[0], SHORT_INPUT)
+        for prepend in (None, b'', memoryview(b'')):
+            ctx, _ = self.__compress_begin(autoflush=True)
+            self.assertEqual(compress_update(ctx, SHORT_INPUT, prepend), expected)
+        ctx, header = self.__compress_begin()
+        data = compress_update(ctx, SHORT_INPUT, prepend=header)
+        self.assertEqual(decompress(data + compress_end(ctx)), SHORT_INPUT)
 
     def test_decompress_update_invalid(self):
         with self.assertRaises(TypeError):
@@ -298,7 +350,7 @@ class TestLowLevelFunctions(TestHelperMixin, TestCase):
             decompress_update(1)
         # invalid context
         with self.assertRaises(ValueError):
-            decompress_update(create_compression_context(), b' ')
+            decompress_update(self.unused_cctx, b' ')
 
         ctx = create_decompression_context()
 
@@ -307,9 +359,9 @@ class TestLowLevelFunctions(TestHelperMixin, TestCase):
         with self.assertRaises(ValueError):
             decompress_update(ctx, b' ', chunk_len=0)
 
-        in_raw = compress(LONG_INPUT, checksum=True)
+        in_raw = compressed(LONG_INPUT, checksum=True)
 
-        ret = decompress_update(ctx, in_raw[:512], chunk_len=2)
+        ret = decompress_update(ctx, memoryview(in_raw)[:512], chunk_len=2)
         # input_hint
         self.assertTrue(ret.pop() > 0)
         # chunk length
@@ -326,12 +378,230 @@ class TestLowLevelFunctions(TestHelperMixin, TestCase):
         with self.assertRaisesLz4FramedError(LZ4F_ERROR_contentChecksum_invalid):
             decompress_update(ctx, in_raw)
 
+    def test_reset_decompression_context(self):  # pylint: disable=invalid-name
+        with self.assertRaises(TypeError):
+            reset_decompression_context()
+        with self.assertRaises(ValueError):
+            reset_decompression_context(self.unused_cctx)
+
+        ctx = create_decompression_context()
+        in_raw = compressed(LONG_INPUT)
+        # abandon frame part-way through
+        decompress_update(ctx, in_raw[:512])
+        reset_decompression_context(ctx)
+        data = decompress_update(ctx, in_raw)
+        self.assertEqual(b''.join(data[:-1]), LONG_INPUT)
+
+    def test_decompress_update_out(self):
+        ctx = create_decompression_context()
+        with self.assertRaises(TypeError):
+            decompress_update(ctx, b' ', out=1)
+        with self.assertRaises(BufferError):
+            decompress_update(ctx, b' ', out=b' ')
+        with self.assertRaises(ValueError):
+            decompress_update(ctx, b' ', out=bytearray())
+
+        in_raw = compressed(LONG_INPUT, block_size_id=LZ4F_BLOCKSIZE_MAX64KB, block_mode_linked=False)
+        out = bytearray(get_block_size(LZ4F_BLOCKSIZE_MAX64KB))
+        input_hint = 15
+        pos = 0
+        output = []
+        while input_hint > 0:
+            ret = decompress_update(ctx, in_raw[pos:pos + input_hint], out=out)
+            pos += input_hint
+            input_hint = ret.pop()
+            self.assertTrue(all(isinstance(chunk, memoryview) for chunk in ret))
+            output.extend(bytes(chunk) for chunk in ret)
+        self.assertEqual(b''.join(output), LONG_INPUT)
+
+        # all of frame cannot fit into one block
+        ctx = create_decompression_context()
+        with self.assertRaisesRegex(ValueError, 'out too small'):
+            decompress_update(ctx, in_raw, out=out)
+
     def test_decompress_update_memoryview(self):  # pylint: disable=invalid-name
         ctx = create_decompression_context()
-        data = decompress_update(ctx, memoryview(compress(LONG_INPUT)))
+        data = decompress_update(ctx, memoryview(compressed(LONG_INPUT)))
         self.assertEqual(b''.join(data[:-1]), LONG_INPUT)
 
 
+class TestStreamingCompression(TestHelperMixin, TestCase):
+    """compress_begin(), compress_update() & compress_end() over a whole input"""
+
+    def __compress_with_data_and_args(self, data, read_size=None, **kwargs):
+        """Compresses data in read_size slices (defaulting to one lz4 block, as determined by block_size_id)"""
+        if read_size is None:
+            read_size = get_block_size(kwargs.get('block_size_id', LZ4F_BLOCKSIZE_DEFAULT))
+        ctx = create_compression_context()
+        header = compress_begin(ctx, **kwargs)
+        # preallocated (with room for lz4 framing overhead) so output does not have to grow
+        out = memoryview(bytearray(len(header) + len(data) + OUTPUT_OVERHEAD))
+        out[:len(header)] = header
+        pos = len(header)
+        # slices of input are not copied
+        view = memoryview(data)
+        update = compress_update
+        for start in range(0, len(view), read_size):
+            chunk = update(ctx, view[start:start + read_size])
+            out[pos:pos + len(chunk)] = chunk
+            pos += len(chunk)
+        chunk = compress_end(ctx)
+        out[pos:pos + len(chunk)] = chunk
+        pos += len(chunk)
+        self.assertEqual(decompress(out[:pos]), data)
+
+    def test_compress(self):
+        func = self.__compress_with_data_and_args
+
+        for size in BLOCK_SIZES:
+            with self.subTest(block_size_id=size):
+                func(LONG_INPUT, block_size_id=size)
+
+        for arg in ('block_mode_linked', 'checksum'):
+            for value in (False, True):
+                with self.subTest(**{arg: value}):
+                    func(LONG_INPUT, **{arg: value})
+
+        for level in LEVELS:
+            with self.subTest(level=level):
+                func(SHORT_INPUT, level=level)
+
+        func(memoryview(LONG_INPUT))
+
+    def test_compress_small_chunks(self):
+        # input smaller than a block, i.e. lz4 has to buffer internally
+        self.__compress_with_data_and_args(LONG_INPUT, read_size=128)
+        self.__compress_with_data_and_args(LONG_INPUT, read_size=128, block_mode_linked=False)
+
+
+class TestIntoAndFdFunctions(TestHelperMixin, TestCase):
+
+    def test_compress_into(self):
+        with self.assertRaises(TypeError):
+            compress_into()
+        with self.assertRaises(TypeError):
+            compress_into(1, b'1')
+        with self.assertRaises(BufferError):
+            compress_into(b' ' * 100, b'1')
+        with self.assertRaises(Lz4FramedNoDataError):
+            compress_into(bytearray(), b'')
+        with self.assertRaisesRegex(ValueError, 'out too small'):
+            compress_into(memoryview(bytearray(10)), SHORT_INPUT)
+
+        # bytearray resized to fit
+        for out in (bytearray(), bytearray(len(LONG_INPUT) * 2)):
+            self.assertEqual(compress_into(out, LONG_INPUT, checksum=True), (len(out), len(LONG_INPUT)))
+            self.assertEqual(decompress(out), LONG_INPUT)
+
+        # fixed size buffer
+        out = bytearray(len(LONG_INPUT) * 2)
+        written, consumed = compress_into(memoryview(out), LONG_INPUT, level=LZ4F_COMPRESSION_MIN_HC)
+        self.assertEqual(consumed, len(LONG_INPUT))
+        self.assertEqual(len(out), len(LONG_INPUT) * 2)
+        self.assertEqual(decompress(out[:written]), LONG_INPUT)
+
+    def test_decompress_into(self):
+        with self.assertRaises(TypeError):
+            decompress_into()
+        with self.assertRaises(TypeError):
+            decompress_into(1, compress(b'1'))
+        with self.assertRaises(Lz4FramedNoDataError):
+            decompress_into(bytearray(), b'')
+        in_raw = compressed(LONG_INPUT)
+        with self.assertRaisesRegex(ValueError, 'frame incomplete'):
+            decompress_into(bytearray(), in_raw[:-1])
+        with self.assertRaisesRegex(ValueError, 'out too small'):
+            decompress_into(memoryview(bytearray(10)), in_raw)
+
+        # with & without content size in header, trailing data not consumed
+        for data in (in_raw, compressed_streamed(LONG_INPUT)):
+            for out in (bytearray(), bytearray(len(LONG_INPUT) * 2)):
+                self.assertEqual(decompress_into(out, data + SHORT_INPUT), (len(LONG_INPUT), len(data)))
+                self.assertEqual(out, LONG_INPUT)
+
+        # fixed size buffer
+        out = bytearray(len(LONG_INPUT) + 1)
+        self.assertEqual(decompress_into(memoryview(out), in_raw), (len(LONG_INPUT), len(in_raw)))
+        self.assertEqual(out[:-1], LONG_INPUT)
+
+    def test_compress_fd(self):
+        with self.assertRaises(TypeError):
+            compress_fd()
+        with self.assertRaises(TypeError):
+            compress_fd('1', 1)
+        with self.assertRaises(ValueError):
+            compress_fd(0, 1, block_size_id=-1)
+        with self.assertRaises(IOError):
+            compress_fd(-1, -1)
+
+        for data, kwargs in ((b'', {}), (SHORT_INPUT, {}), (LONG_INPUT, {}),
+                             (LONG_INPUT, {'block_size_id': LZ4F_BLOCKSIZE_MAX4MB, 'checksum': True, 'level': 9}),
+                             (LONG_INPUT, {'block_mode_linked': False, 'block_checksum': True})):
+            with TemporaryFile() as in_file, TemporaryFile() as out_file:
+                in_file.write(data)
+                in_file.flush()
+                in_file.seek(0)
+                compress_fd(in_file.fileno(), out_file.fileno(), **kwargs)
+                out_file.seek(0)
+                self.assertEqual(decompress(out_file.read()), data)
+
+        # compression starts from current (unaligned) offset & consumes remainder of file
+        with TemporaryFile() as in_file, TemporaryFile() as out_file:
+            in_file.write(SHORT_INPUT + LONG_INPUT)
+            in_file.flush()
+            in_file.seek(len(SHORT_INPUT))
+            compress_fd(in_file.fileno(), out_file.fileno())
+            self.assertEqual(in_file.tell(), len(SHORT_INPUT) + len(LONG_INPUT))
+            out_file.seek(0)
+            self.assertEqual(decompress(out_file.read()), LONG_INPUT)
+
+        # non-regular file input
+        read_fd, write_fd = pipe()
+        try:
+            with TemporaryFile() as out_file:
+                write(write_fd, SHORT_INPUT)
+                close(write_fd)
+                write_fd = None
+                compress_fd(read_fd, out_file.fileno())
+                out_file.seek(0)
+                self.assertEqual(decompress(out_file.read()), SHORT_INPUT)
+        finally:
+            close(read_fd)
+            if write_fd is not None:
+                close(write_fd)
+
+    def test_decompress_fd(self):
+        with self.assertRaises(TypeError):
+            decompress_fd()
+        with self.assertRaises(IOError):
+            decompress_fd(-1, -1)
+
+        for name, data in (('short', SHORT_INPUT), ('long', LONG_INPUT)):
+            with self.subTest(input=name), TemporaryFile() as in_file, TemporaryFile() as out_file:
+                # only one frame should be read
+                in_file.write(compressed(data, block_size_id=LZ4F_BLOCKSIZE_MAX256KB) + compressed(SHORT_INPUT))
+                in_file.flush()
+                in_file.seek(0)
+                decompress_fd(in_file.fileno(), out_file.fileno())
+                decompress_fd(in_file.fileno(), out_file.fileno())
+                out_file.seek(0)
+                self.assertEqual(out_file.read(), data + SHORT_INPUT)
+
+        with TemporaryFile() as in_file, TemporaryFile() as out_file:
+            in_file.write(compressed(LONG_INPUT)[:-32])
+            in_file.flush()
+            in_file.seek(0)
+            with self.assertRaises(Lz4FramedNoDataError):
+                decompress_fd(in_file.fileno(), out_file.fileno())
+
+            in_file.seek(0)
+            in_file.write(b'invalidheader')
+            in_file.flush()
+            in_file.seek(0)
+            with self.assertRaisesLz4FramedError(LZ4F_ERROR_frameType_unknown):
+                decompress_fd(in_file.fileno(), out_file.fileno())
+
+
 class TestCompressor(TestHelperMixin, TestCase):
     """Note: Low-level methods supporting Compressor class have been tested in TestLowLevelFunctions"""
 
@@ -351,40 +621,100 @@ class TestCompressor(TestHelperMixin, TestCase):
                 pass
 
     def test_compressor__no_fp(self):
-        in_bytes = BytesIO(LONG_INPUT)
-        out_bytes = BytesIO()
+        # preallocated (with room for lz4 framing overhead) so output does not have to grow
+        out = memoryview(bytearray(len(LONG_INPUT) + OUTPUT_OVERHEAD))
+        pos = 0
 
         compressor = Compressor()
-        try:
-            while True:
-                out_bytes.write(compressor.update(in_bytes.read(1024)))
-        # raised by compressor.update() on empty data argument
-        except Lz4FramedNoDataError:
-            pass
-        out_bytes.write(compressor.end())
+        view = memoryview(LONG_INPUT)
+        for start in range(0, len(view), READ_SIZE):
+            # not bound to local since update() replaces itself after first call. (Without fp it returns output - pylint
+            # infers the fp-bound variant.)
+            chunk = compressor.update(view[start:start + READ_SIZE])  # pylint: disable=assignment-from-no-return
+            out[pos:pos + len(chunk)] = chunk
+            pos += len(chunk)
+        with self.assertRaises(Lz4FramedNoDataError):
+            compressor.update(b'')
+        chunk = compressor.end()
+        out[pos:pos + len(chunk)] = chunk
+        pos += len(chunk)
 
-        self.assertEqual(decompress(out_bytes.getvalue()), LONG_INPUT)
+        self.assertEqual(decompress(out[:pos]), LONG_INPUT)
 
     def test_compressor_fp(self):
-        self.__fp_test()
+        for name, in_raw in (('long', LONG_INPUT), ('mixed', MIXED_INPUT)):
+            with self.subTest(input=name):
+                self.__fp_test(in_raw=in_raw)
+
+    def test_compressor_end(self):
+        compressor = Compressor()
+        output = compressor.update(SHORT_INPUT) + compressor.end()
+        self.assertEqual(decompress(output), SHORT_INPUT)
+        # context no longer available after frame has been finalised
+        with self.assertRaises(ValueError):
+            compressor.update(SHORT_INPUT)
+        with self.assertRaises(ValueError):
+            compressor.end()
+
+    def test_compressor_empty(self):
+        # frame without any data is still valid
+        self.assertEqual(decompress(Compressor().end()), b'')
+        out_bytes = BytesIO()
+        with Compressor(out_bytes) as _:  # noqa (unused variable)
+            pass
+        self.assertEqual(decompress(out_bytes.getvalue()), b'')
 
     def __fp_test(self, in_raw=LONG_INPUT, **kwargs):
-        in_bytes = BytesIO(in_raw)
         out_bytes = BytesIO()
 
+        view = memoryview(in_raw)
         with Compressor(out_bytes, **kwargs) as compressor:
-            try:
-                while True:
-                    compressor.update(in_bytes.read(1024))
-            # raised by compressor.update() on empty data argument
-            except Lz4FramedNoDataError:
-                pass
+            # with fp, update() is bound at construction
+            update = compressor.update
+            for start in range(0, len(view), READ_SIZE):
+                update(view[start:start + READ_SIZE])
+            with self.assertRaises(Lz4FramedNoDataError):
+                update(b'')
         self.assertEqual(decompress(out_bytes.getvalue()), in_raw)
 
+    def test_compressor_thread_safe(self):
+        self.__fp_test(thread_safe=True)
+        self.__fp_test(thread_safe=False)
+
+        # concurrent update() & end() calls: updates either complete before end() or fail afterwards
+        for use_fp in (True, False):
+            with self.subTest(fp=use_fp):
+                out_bytes = BytesIO()
+                compressor = Compressor(out_bytes if use_fp else None)
+                output = []
+                errors = []
+
+                def update(compressor, output, errors):
+                    try:
+                        for _ in range(200):
+                            output.append(compressor.update(SHORT_INPUT))
+                    except ValueError:
+                        # compressor ended
+                        pass
+                    except Exception as ex:  # pylint: disable=broad-except
+                        errors.append(ex)
+
+                threads = [Thread(target=update, args=(compressor, output, errors)) for _ in range(4)]
+                for thread in threads:
+                    thread.start()
+                end_output = compressor.end()
+                for thread in threads:
+                    thread.join()
+                self.assertEqual(errors, [])
+                # frame must be complete, i.e. contain all data from successful updates. (Input totals less than one
+                # block so only the first update returns any output, i.e. order of output list does not matter.)
+                in_raw = out_bytes.getvalue() if use_fp else b''.join(output) + end_output
+                self.assertEqual(decompress(in_raw), SHORT_INPUT * len(output))
+
     def test_compressor_block_size(self):
-        for block_size in (LZ4F_BLOCKSIZE_DEFAULT, LZ4F_BLOCKSIZE_MAX64KB, LZ4F_BLOCKSIZE_MAX256KB,
-                           LZ4F_BLOCKSIZE_MAX1MB, LZ4F_BLOCKSIZE_MAX4MB):
-            self.__fp_test(block_size_id=block_size)
+        for block_size in BLOCK_SIZES:
+            with self.subTest(block_size_id=block_size):
+                self.__fp_test(block_size_id=block_size)
 
     def test_compressor_checksum(self):
         self.__fp_test(checksum=False)
@@ -395,12 +725,29 @@ class TestCompressor(TestHelperMixin, TestCase):
         self.__fp_test(autoflush=False)
 
     def test_compressor_level(self):
-        for level in range(LEVEL_ACCELERATED_MAX, LZ4F_COMPRESSION_MAX + 1):
-            self.__fp_test(in_raw=SHORT_INPUT, level=level)
-        self.__fp_test(level=0)
-        # levels > 10 (v1.7.5) are significantly slower
+        for level in LEVELS:
+            with self.subTest(level=level):
+                self.__fp_test(in_raw=SHORT_INPUT, level=level)
+        # large input at hc level only (default fast level already covered by other tests). Levels > 10 (v1.7.5) are
+        # significantly slower.
         self.__fp_test(level=10)
 
+    def test_compressor_context_pool(self):
+        pool = []
+        ctx = create_compression_context()
+        for block_size in (LZ4F_BLOCKSIZE_MAX1MB, LZ4F_BLOCKSIZE_MAX4MB):
+            _release_context(pool, ctx, block_size)
+            self.assertEqual(pool, [])
+        _release_context(pool, ctx, LZ4F_BLOCKSIZE_MAX64KB)
+        self.assertEqual(pool, [ctx])
+
+        # context used for large blocks must not be retained
+        pool_size = len(_cctx_pool)
+        compressor = Compressor(block_size_id=LZ4F_BLOCKSIZE_MAX4MB)
+        compressor.update(SHORT_INPUT)
+        compressor.end()
+        self.assertLessEqual(len(_cctx_pool), pool_size)
+
 
 class TestDecompressor(TestHelperMixin, TestCase):
 
@@ -418,21 +765,105 @@ class TestDecompressor(TestHelperMixin, TestCase):
 
     def test_decompressor_fp(self):
         # levels > 10 (v1.7.5) are significantly slower
+        # output compared via digest to avoid retaining it (full comparison below)
         for level in (LEVEL_ACCELERATED_MAX, 10):
-            out_bytes = BytesIO()
-            for chunk in Decompressor(BytesIO(compress(LONG_INPUT, level=level))):
-                out_bytes.write(chunk)
-            self.assertEqual(out_bytes.getvalue(), LONG_INPUT)
+            for reuse_buffer in (False, True):
+                digest = blake2b(digest_size=16)
+                for chunk in Decompressor(BytesIO(compressed(LONG_INPUT, level=level)), reuse_buffer=reuse_buffer):
+                    digest.update(chunk)
+                self.assertEqual(digest.digest(), LONG_INPUT_DIGEST)
+
+        for thread_safe in (True, False):
+            data = b''.join(Decompressor(BytesIO(compressed(LONG_INPUT)), thread_safe=thread_safe))
+            self.assertEqual(data, LONG_INPUT)
+
+        # subsequent iteration decompresses next frame
+        in_bytes = BytesIO(compressed(SHORT_INPUT) + compressed(LONG_INPUT))
+        decompressor = Decompressor(in_bytes)
+        self.assertEqual(b''.join(decompressor), SHORT_INPUT)
+        self.assertEqual(b''.join(decompressor), LONG_INPUT)
 
         # incomplete frame
-        out_bytes.truncate()
+        out_bytes = BytesIO()
         with self.assertRaises(Lz4FramedNoDataError):
-            for chunk in Decompressor(BytesIO(compress(LONG_INPUT)[:-32])):
+            for chunk in Decompressor(BytesIO(compressed(LONG_INPUT)[:-32])):
                 out_bytes.write(chunk)
-        # some data should have been written
-        out_bytes.seek(SEEK_END)
+        # some data should have been written (position is at end after writes)
         self.assertTrue(out_bytes.tell() > 0)
 
+    def test_decompressor_reuse_buffer(self):
+        # streamed (i.e. no content size), with partially incompressible (i.e. uncompressed) blocks
+        for linked, checksum in product((True, False), (True, False)):
+            with self.subTest(block_mode_linked=linked, checksum=checksum):
+                with BytesIO() as in_bytes:
+                    with Compressor(in_bytes, block_checksum=True, block_mode_linked=linked, checksum=checksum) as comp:
+                        comp.update(MIXED_INPUT)
+                    in_raw = in_bytes.getvalue()
+                # each chunk only valid until next iteration
+                out_bytes = BytesIO()
+                for chunk in Decompressor(BytesIO(in_raw), reuse_buffer=True):
+                    out_bytes.write(chunk)
+                self.assertEqual(out_bytes.getvalue(), MIXED_INPUT)
+
+    def test_decompressor_context_pool(self):
+        # context used for large blocks must not be retained
+        pool_size = len(_dctx_pool)
+        # streamed since one-shot compression reduces block size to fit input
+        compressor = Compressor(block_size_id=LZ4F_BLOCKSIZE_MAX4MB)
+        in_raw = compressor.update(SHORT_INPUT) + compressor.end()
+        self.assertEqual(b''.join(Decompressor(BytesIO(in_raw))), SHORT_INPUT)
+        self.assertLessEqual(len(_dctx_pool), pool_size)
+
+
+class TestCommandLine(TestCase):
+
+    def test_block_size_id(self):
+        # module-private (and would be name-mangled if accessed as an attribute within class)
+        block_size_id = getattr(command_line, '__block_size_id')
+
+        for size, expected in ((0, LZ4F_BLOCKSIZE_MAX64KB),
+                               (4 << 20, LZ4F_BLOCKSIZE_MAX64KB),
+                               ((4 << 20) + 1, LZ4F_BLOCKSIZE_MAX1MB),
+                               (64 << 20, LZ4F_BLOCKSIZE_MAX1MB),
+                               ((64 << 20) + 1, LZ4F_BLOCKSIZE_MAX4MB)):
+            with self.subTest(size=size), TemporaryFile() as in_file:
+                # sparse, i.e. size does not have to be written
+                in_file.truncate(size)
+                self.assertEqual(block_size_id(in_file.fileno()), expected)
+
+        # unknown & non-regular inputs
+        self.assertEqual(block_size_id(None), LZ4F_BLOCKSIZE_MAX64KB)
+        self.assertEqual(block_size_id(-1), LZ4F_BLOCKSIZE_MAX64KB)
+        read_fd, write_fd = pipe()
+        try:
+            self.assertEqual(block_size_id(read_fd), LZ4F_BLOCKSIZE_MAX64KB)
+        finally:
+            close(read_fd)
+            close(write_fd)
+
+    def test_do_compress_raw_output(self):
+        class RawBytesIO(RawIOBase):
+            """Unbuffered stream backed by BytesIO"""
+
+            def __init__(self):
+                super().__init__()
+                self.bytes = BytesIO()
+
+            def writable(self):
+                return True
+
+            def write(self, b):
+                return self.bytes.write(b)
+
+        out_raw = RawBytesIO()
+        self.assertEqual(command_line.do_compress(BytesIO(LONG_INPUT), out_raw), 0)
+        self.assertEqual(decompress(out_raw.bytes.getvalue()), LONG_INPUT)
+        # buffering wrapper must not have closed the stream (including on finalisation)
+        collect()
+        self.assertFalse(out_raw.closed)
+        out_raw.write(SHORT_INPUT)
+        self.assertTrue(out_raw.bytes.getvalue().endswith(SHORT_INPUT))
+
 
 # def pympler_run(iterations=20):
 #     from unittest import main